@@ -4,10 +4,10 @@ Created on Thu Jul 30 16:20:06 2020
 
 @author: Nathan Pulver, nathan.pulver@jpl.nasa.gov , nwpulver@cpp.edu
 """
-import folium
-from folium import plugins
-import branca.colormap as cm
-import matplotlib.pyplot as plt
+from stage_timer import stage
+
+# folium, branca and matplotlib are imported where they are used; they are
+# slow to import and only needed once a map is drawn.
 
 ucerf3 = "UCERF3_.geojson"
 
@@ -19,6 +19,8 @@ def create_contour_overlay(Lon, Lat, Z):
     it allowed for much faster load times than trying to plot
     color coated points on folium.
     """
+    import matplotlib.pyplot as plt
+
     fig, ax = plt.subplots(nrows=1, ncols=1)
     ax.tricontourf(Lon, Lat, Z, cmap="seismic")
     # everything below this is to remove white space and axis from plot
@@ -34,7 +36,7 @@ def create_contour_overlay(Lon, Lat, Z):
 
 
 # this is essentially the same as the one in getDisplacement.ipynb
-def create_map(df, lon_col="Lon", lat_col="Lat", data_col="Delta N"):
+def create_map(df, lon_col="Lon", lat_col="Lat", data_col="Delta N", report=None):
     """
     Parameters
     ----------
@@ -48,10 +50,24 @@ def create_map(df, lon_col="Lon", lat_col="Lat", data_col="Delta N"):
         Name of column with values to be colormapped. Default is 'Delta N'
     site_col:
         Name of column with GPS site names.
+    report:
+        Optional stage_timer.PipelineReport; the contour rendering is
+        recorded as its own stage inside create_map.
     -------
     Returns:
         Folium map object
     """
+    with stage(report, "create_map") as record:
+        my_map = _create_map(df, lon_col, lat_col, data_col, report)
+        record.rows_parsed += len(df)
+    return my_map
+
+
+def _create_map(df, lon_col, lat_col, data_col, report):
+    import folium
+    from folium import plugins
+    import branca.colormap as cm
+
     start_cords = (df[lat_col].median(), df[lon_col].median())
     my_map = folium.Map(
         start_cords,
@@ -71,7 +87,8 @@ def create_map(df, lon_col="Lon", lat_col="Lat", data_col="Delta N"):
     minimum = df[data_col].min()
     maximum = df[data_col].max()
     colormap = cm.LinearColormap(colors=colors_list, vmin=minimum, vmax=maximum)
-    create_contour_overlay(df[lon_col], df[lat_col], df[data_col])
+    with stage(report, "contour_overlay"):
+        create_contour_overlay(df[lon_col], df[lat_col], df[data_col])
 
     folium.raster_layers.ImageOverlay(
         f"contour_of_{df[data_col].name}.png",
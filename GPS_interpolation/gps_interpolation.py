@@ -1,6 +1,9 @@
 import numpy as np
-import pandas as pd
-from pykrige.ok import OrdinaryKriging
+
+from stage_timer import stage
+
+# pandas and pykrige are imported in the functions that use them, so that
+# importing this module (or getDisplacement next to it) stays cheap.
 
 
 def create_grid(array, spacing=0.005):
@@ -18,6 +21,8 @@ def reshape_and_create_df(grid_x, grid_y, z1, new=True, z_name="Z"):
     otherwise you can get a dictionairy out to add a single col to an
     existing data frame
     """
+    import pandas as pd
+
     if new == True:
 
         mesh_x, mesh_y = np.meshgrid(grid_x, grid_y)
@@ -43,10 +48,27 @@ def reshape_and_create_df(grid_x, grid_y, z1, new=True, z_name="Z"):
 
 
 def interpolate(
-    x, y, grid_spacing=0.004, model="spherical", returngrid=False, **kwargs
+    x,
+    y,
+    grid_spacing=0.004,
+    model="spherical",
+    returngrid=False,
+    report=None,
+    **kwargs
 ):
     """Interpolates any number of z values
-    and uses create_grid to create a grid of values based on min and max of x and y"""
+    and uses create_grid to create a grid of values based on min and max of x and y.
+    Pass a stage_timer.PipelineReport as report to time the kriging per component"""
+    with stage(report, "interpolate") as record:
+        df = _interpolate(x, y, grid_spacing, model, report, **kwargs)
+        record.stations += len(x)
+        record.rows_parsed += len(df)
+    return df
+
+
+def _interpolate(x, y, grid_spacing, model, report, **kwargs):
+    from pykrige.ok import OrdinaryKriging
+
     grid_x = create_grid(x, spacing=grid_spacing)
     grid_y = create_grid(y, spacing=grid_spacing)
     counter = 0
@@ -54,32 +76,34 @@ def interpolate(
 
         if counter == 0:
             # nlags is number of averaging bins, default is 6 and I found much better results with higher values
-            OK = OrdinaryKriging(
-                x,
-                y,
-                v,
-                variogram_model=model,
-                verbose=False,
-                enable_plotting=False,
-                nlags=40,
-                coordinates_type="geographic",
-            )
-            z1, ss1 = OK.execute("grid", grid_x, grid_y, mask=False)
+            with stage(report, "kriging"):
+                OK = OrdinaryKriging(
+                    x,
+                    y,
+                    v,
+                    variogram_model=model,
+                    verbose=False,
+                    enable_plotting=False,
+                    nlags=40,
+                    coordinates_type="geographic",
+                )
+                z1, ss1 = OK.execute("grid", grid_x, grid_y, mask=False)
             vals = np.ma.getdata(z1)
             sigma = np.ma.getdata(ss1)
             df = reshape_and_create_df(grid_x, grid_y, vals, z_name=k)
             counter += 1
         else:
-            OK = OrdinaryKriging(
-                x,
-                y,
-                v,
-                variogram_model=model,
-                verbose=False,
-                enable_plotting=False,
-                nlags=40,
-            )
-            z1, ss1 = OK.execute("grid", grid_x, grid_y, mask=False)
+            with stage(report, "kriging"):
+                OK = OrdinaryKriging(
+                    x,
+                    y,
+                    v,
+                    variogram_model=model,
+                    verbose=False,
+                    enable_plotting=False,
+                    nlags=40,
+                )
+                z1, ss1 = OK.execute("grid", grid_x, grid_y, mask=False)
             vals = np.ma.getdata(z1)
             sigma = np.ma.getdata(ss1)
             col = reshape_and_create_df(grid_x, grid_y, vals, z_name=k, new=False)
@@ -5,11 +5,14 @@ Created on Wed Jul 29 16:42:08 2020
 @author: Nathan Pulver nathan.pulver@jpl.nasa.gov, nwpulver@cpp.edu
 """
 
+import os
+
 import numpy as np
-import pandas as pd
+
+from stage_timer import stage
 
 
-def load_gps_data(filename):
+def load_gps_data(filename, report=None):
     """
 
 
@@ -18,12 +21,22 @@ def load_gps_data(filename):
     filename :
         GPS data as retreived from geo-gateway.org as a txt file.
         or from getDisplacement.py
+    report :
+        Optional stage_timer.PipelineReport to record the load in.
     Returns
     -------
     Pandas Dataframe of Lon, Lat, and Delta Values
 
     """
-    gps_in = np.loadtxt(filename, skiprows=(1), usecols=(1, 2, 3, 4, 5))
+    import pandas as pd
+
+    with stage(report, "load_gps_data") as record:
+        gps_in = np.loadtxt(filename, skiprows=(1), usecols=(1, 2, 3, 4, 5), ndmin=2)
+        # np.loadtxt also reads open files and lists of lines, which have no size
+        if isinstance(filename, (str, bytes, os.PathLike)):
+            record.bytes_fetched += os.path.getsize(filename)
+        record.rows_parsed += len(gps_in)
+        record.stations += len(gps_in)
     gps_dict = {
         "Lon": gps_in[:, 0],
         "Lat": gps_in[:, 1],
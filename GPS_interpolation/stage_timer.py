@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+"""
+Opt-in per-stage instrumentation for the displacement and interpolation
+pipeline.
+
+A PipelineReport is handed to getDisplacement, interpolate, load_gps_data
+or create_map through their ``report`` keyword.  Each of them wraps its
+network, parsing, kriging and rendering work in named stages; a stage that
+is entered several times (one fetch per station, say) accumulates into a
+single record.  Nothing is measured when no report is given.
+
+Example
+-------
+    with PipelineReport(trace_memory=True, profile_dir="prof") as report:
+        table = getDisplacement(parameters, report=report)
+        grid = interpolate(lon, lat, report=report, **deltas)
+    report.print_summary()
+    report.save("timing.json")
+"""
+
+import os
+import json
+import time
+
+# tracemalloc is imported only when memory tracing is asked for; it pulls
+# in pickle and would otherwise dominate the import time of the CLI.
+
+
+class StageRecord:
+    """Accumulated measurements of one named stage."""
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.wall_time = 0.0
+        self.thread_time = 0.0
+        self.bytes_fetched = 0
+        self.rows_parsed = 0
+        self.stations = 0
+        self.peak_memory = None
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "calls": self.calls,
+            "wall_time": self.wall_time,
+            "thread_time": self.thread_time,
+            "bytes_fetched": self.bytes_fetched,
+            "rows_parsed": self.rows_parsed,
+            "stations": self.stations,
+            "peak_memory": self.peak_memory,
+        }
+
+
+class _Stage:
+    """Context manager returned by PipelineReport.stage."""
+
+    def __init__(self, report, record):
+        self.report = report
+        self.record = record
+        self.profiler = None
+
+    def __enter__(self):
+        report = self.report
+        if report.trace_memory:
+            import tracemalloc
+
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                report._started_tracing = True
+            # hand the peak seen so far to the enclosing stages before
+            # resetting it for this one
+            peak = tracemalloc.get_traced_memory()[1]
+            for outer in report._open:
+                outer._peak = max(outer._peak, peak)
+            tracemalloc.reset_peak()
+        self._peak = 0
+        if report.profile_dir is not None and not report._open:
+            import cProfile
+
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        report._open.append(self)
+        self._start = time.perf_counter()
+        return self.record
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self._start
+        report = self.report
+        report._open.pop()
+        if self.profiler is not None:
+            self.profiler.disable()
+            os.makedirs(report.profile_dir, exist_ok=True)
+            self.profiler.dump_stats(
+                os.path.join(report.profile_dir, self.record.name + ".prof")
+            )
+        record = self.record
+        record.calls += 1
+        record.wall_time += elapsed
+        if report.trace_memory:
+            import tracemalloc
+
+            if tracemalloc.is_tracing():
+                peak = max(self._peak, tracemalloc.get_traced_memory()[1])
+                for outer in report._open:
+                    outer._peak = max(outer._peak, peak)
+                if record.peak_memory is None or peak > record.peak_memory:
+                    record.peak_memory = peak
+        return False
+
+
+class _NullStage:
+    """Stand-in used when no report was requested; counters are discarded."""
+
+    def __enter__(self):
+        return StageRecord(None)
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+class PipelineReport:
+    """
+    Collects wall time, bytes fetched, rows parsed, stations processed and
+    peak memory per stage.
+
+    Parameters
+    ----------
+    trace_memory :
+        Track peak Python heap use per stage with tracemalloc. This slows
+        the run down noticeably, so it is off by default.
+    profile_dir :
+        If given, every outermost stage runs under cProfile and its stats
+        are dumped to ``<profile_dir>/<stage>.prof`` (later calls of the
+        same stage overwrite earlier dumps).
+    """
+
+    def __init__(self, trace_memory=False, profile_dir=None):
+        self.trace_memory = trace_memory
+        self.profile_dir = profile_dir
+        self.stages = {}
+        self._open = []
+        self._started = time.perf_counter()
+        self._finished = None
+        self._started_tracing = False
+
+    def stage(self, name):
+        """Return a context manager timing the named stage; it yields the
+        StageRecord so callers can add to its counters."""
+        if name not in self.stages:
+            self.stages[name] = StageRecord(name)
+        return _Stage(self, self.stages[name])
+
+    def close(self):
+        """Freeze the total wall time and stop tracemalloc if we started it."""
+        if self._finished is None:
+            self._finished = time.perf_counter()
+        if self._started_tracing:
+            import tracemalloc
+
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def merge(self, other, prefix="", threaded=False):
+        """
+        Add the stages of another report to this one, under prefix + name.
+        Stages are not thread safe, so work run in threads records into a
+        report of its own that is merged afterwards.  With threaded, the
+        other report ran alongside others merged into the same stages: its
+        wall time is added to thread_time, summed time spent in threads,
+        and the wall clock is left to a stage around the whole pool.
+        """
+        for name, theirs in other.stages.items():
+            name = prefix + name
+            if name not in self.stages:
+                self.stages[name] = StageRecord(name)
+            record = self.stages[name]
+            record.calls += theirs.calls
+            if threaded:
+                record.thread_time += theirs.wall_time + theirs.thread_time
+            else:
+                record.wall_time += theirs.wall_time
+                record.thread_time += theirs.thread_time
+            record.bytes_fetched += theirs.bytes_fetched
+            record.rows_parsed += theirs.rows_parsed
+            record.stations += theirs.stations
+            if theirs.peak_memory is not None:
+                record.peak_memory = max(record.peak_memory or 0, theirs.peak_memory)
+                # the other report reset the peak under the stages open here
+                for outer in self._open:
+                    outer._peak = max(outer._peak, theirs.peak_memory)
+
+    def to_dict(self):
+        end = self._finished if self._finished is not None else time.perf_counter()
+        return {
+            "total_wall_time": end - self._started,
+            "stages": [record.to_dict() for record in self.stages.values()],
+        }
+
+    def to_json(self, **kwargs):
+        return json.dumps(self.to_dict(), **kwargs)
+
+    def save(self, filename):
+        with open(filename, "w") as outFile:
+            json.dump(self.to_dict(), outFile, indent=2)
+
+    def print_summary(self, file=None):
+        """Print a fixed-width table of the stages in the order first seen;
+        Thread(s) is the time summed over worker threads, if any."""
+        report = self.to_dict()
+        print(
+            "Stage                    Calls   Wall(s) Thread(s)      Bytes       Rows  Stations   Peak(MB)",
+            file=file,
+        )
+        for stage in report["stages"]:
+            peak = stage["peak_memory"]
+            peak = "" if peak is None else "{:.1f}".format(peak / 2 ** 20)
+            threads = stage["thread_time"]
+            threads = "" if not threads else "{:.3f}".format(threads)
+            print(
+                "{:24s} {:5d} {:9.3f} {:>9s} {:10d} {:10d} {:9d} {:>10s}".format(
+                    stage["name"],
+                    stage["calls"],
+                    stage["wall_time"],
+                    threads,
+                    stage["bytes_fetched"],
+                    stage["rows_parsed"],
+                    stage["stations"],
+                    peak,
+                ),
+                file=file,
+            )
+        print("Total wall time {:.3f} s".format(report["total_wall_time"]), file=file)
+
+
+def stage(report, name):
+    """
+    Return ``report.stage(name)``, or a no-op stage when report is None, so
+    instrumented code reads the same whether or not timing was requested.
+    """
+    if report is None:
+        return _NullStage()
+    return report.stage(name)
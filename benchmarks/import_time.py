@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Import-time benchmark for the notebook modules and the getDisplacement CLI.
+
+Each target runs in a fresh interpreter several times and the best wall
+time is kept, together with the heavy third-party packages that ended up
+loaded.  With --against REV the same targets are also timed on the
+getDisplacement and GPS_interpolation directories of an earlier git
+revision, to show the gain of the lazy imports.
+
+Example
+-------
+    python benchmarks/import_time.py --against HEAD~1 -o import_time.json
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+here = os.path.dirname(os.path.abspath(__file__))
+top = os.path.dirname(here)
+
+HEAVY = ("numpy", "pandas", "scipy", "pykrige", "matplotlib", "folium", "branca")
+
+# (name, directory, statement run after the import path is set up)
+TARGETS = (
+    ("interpreter", "getDisplacement", "pass"),
+    ("getDisplacementNGL", "getDisplacement", "import getDisplacementNGL"),
+    ("getDisplacement --help", "getDisplacement",
+     "import sys, getDisplacementNGL; sys.argv = ['getDisplacementNGL.py', '--help']\n"
+     "try:\n    getDisplacementNGL.main()\nexcept SystemExit:\n    pass"),
+    ("gps_interpolation", "getDisplacement", "import gps_interpolation"),
+    ("load_gps_data", "GPS_interpolation", "import load_gps_data"),
+    ("create_map", "GPS_interpolation", "import create_map"),
+)
+
+_PROBE = """
+import sys, time, io, contextlib
+start = time.perf_counter()
+with contextlib.redirect_stdout(io.StringIO()):
+{body}
+elapsed = time.perf_counter() - start
+print(elapsed)
+print(",".join(name for name in {heavy!r} if name in sys.modules))
+"""
+
+
+def time_target(directory, statement, repeat):
+    """Best wall time of statement in a fresh interpreter started in
+    directory, and the heavy packages it loaded."""
+    body = "\n".join("    " + line for line in statement.splitlines())
+    code = _PROBE.format(body=body, heavy=HEAVY)
+    best = None
+    loaded = ""
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = subprocess.run([sys.executable, "-c", code], cwd=directory,
+                             stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                             check=False)
+        total = time.perf_counter() - start
+        if out.returncode != 0:
+            return {"error": out.stderr.decode().strip().splitlines()[-1]}
+        lines = out.stdout.decode().splitlines()
+        if best is None or total < best["process"]:
+            best = {"process": total, "import": float(lines[-2])}
+            loaded = lines[-1]
+    best["loaded"] = [name for name in loaded.split(",") if name]
+    return best
+
+
+def run(root, repeat):
+    results = {}
+    for name, subdir, statement in TARGETS:
+        results[name] = time_target(os.path.join(root, subdir), statement, repeat)
+    return results
+
+
+def checkout(rev, destination):
+    """Extract the module directories of a git revision into destination."""
+    archive = subprocess.run(
+        ["git", "-C", top, "archive", rev, "getDisplacement", "GPS_interpolation"],
+        stdout=subprocess.PIPE, check=True)
+    subprocess.run(["tar", "-x", "-C", destination], input=archive.stdout, check=True)
+
+
+def _getParser():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-o", dest="output", default=None, help="result json file")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per target; the best is kept")
+    parser.add_argument("--against", default=None, help="git revision to compare with")
+    return parser
+
+
+def main():
+    args = _getParser().parse_args()
+    results = {"current": run(top, args.repeat)}
+    if args.against is not None:
+        tmp = tempfile.mkdtemp(prefix="import_time_")
+        try:
+            checkout(args.against, tmp)
+            results[args.against] = run(tmp, args.repeat)
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    for name, _, _ in TARGETS:
+        current = results["current"][name]
+        line = "{:24s}".format(name)
+        if "error" in current:
+            line += " error: " + current["error"]
+        else:
+            line += " {:7.3f} s  {:s}".format(current["process"], " ".join(current["loaded"]))
+        if args.against is not None:
+            before = results[args.against][name]
+            if "error" in before or "error" in current:
+                line += "   (no comparison)"
+            else:
+                line += "   was {:7.3f} s ({:.0%})".format(
+                    before["process"], current["process"] / before["process"])
+        print(line)
+
+    if args.output is not None:
+        with open(args.output, "w") as outFile:
+            json.dump(results, outFile, indent=2)
+
+
+if __name__ == "__main__":
+    main()
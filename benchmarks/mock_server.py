@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""
+Local HTTP stand-in for the JPL and NGL data servers.
+
+Serves a directory written by synthetic_gnss.write_archive from a background
+thread and hands out a ``dataSources`` mapping that getDisplacementNGL can
+use in place of the real URLs.  Single byte ranges (``Range: bytes=N-``)
+are honoured unless the server is created with ranges=False, so both
+refresh paths of series_store can be exercised.
+
+Example
+-------
+    with MockDataServer(root) as server:
+        getDisplacementNGL.dataSources = server.sources()
+        getDisplacement(parameters)
+"""
+
+import os
+import time
+import functools
+import threading
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+
+class _QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def _wait(self):
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+    def do_HEAD(self):
+        self._wait()
+        return super().do_HEAD()
+
+    def do_GET(self):
+        self._wait()
+        byterange = self.headers.get("Range")
+        path = self.translate_path(self.path)
+        if not self.server.ranges or byterange is None or not os.path.isfile(path):
+            return super().do_GET()
+        stat = os.stat(path)
+        size = stat.st_size
+        try:
+            first, last = byterange.split("=", 1)[1].split("-", 1)
+            first = int(first)
+            last = int(last) if last else size - 1
+        except (IndexError, ValueError):
+            return super().do_GET()
+        if first >= size:
+            self.send_response(416)
+            self.send_header("Content-Range", "bytes */{:d}".format(size))
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        last = min(last, size - 1)
+        with open(path, "rb") as inFile:
+            inFile.seek(first)
+            body = inFile.read(last - first + 1)
+        self.send_response(206)
+        self.send_header("Content-Type", self.guess_type(path))
+        self.send_header("Content-Range", "bytes {:d}-{:d}/{:d}".format(first, last, size))
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Last-Modified", self.date_time_string(stat.st_mtime))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class _Server(ThreadingHTTPServer):
+    # the default backlog of 5 makes concurrent fetches wait for SYN retries
+    request_queue_size = 64
+
+
+class MockDataServer:
+    """
+    Parameters
+    ----------
+    root :
+        Directory holding jpl/ and ngl/ subdirectories.
+    host, port :
+        Address to bind; port 0 picks a free port.
+    ranges :
+        Answer Range requests with 206 partial content; when False every
+        request gets the whole file, like a server without range support.
+    latency :
+        Seconds each request waits before it is answered, to mimic the
+        round trip to a remote server.
+    """
+
+    def __init__(self, root, host="127.0.0.1", port=0, ranges=True, latency=0.0):
+        handler = functools.partial(_QuietHandler, directory=root)
+        self.httpd = _Server((host, port), handler)
+        self.httpd.ranges = ranges
+        self.httpd.latency = latency
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return "http://{:s}:{:d}".format(host, port)
+
+    def sources(self):
+        """Return a replacement for getDisplacementNGL.dataSources."""
+        return {
+            "JPL": {
+                "table": self.url + "/jpl/table2.html",
+                "series": self.url + "/jpl/series/{:s}.series",
+            },
+            "NGL": {
+                "table": self.url + "/ngl/llh.out",
+                "series": self.url + "/ngl/tenv3/{:s}.tenv3",
+            },
+        }
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+        return False
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Offline benchmark of getDisplacement, interpolate and create_map.
+
+Generates synthetic JPL/NGL archives for a ladder of station counts, serves
+them from a local MockDataServer and times getDisplacement, interpolate
+plus create_map for each grid spacing, and the whole pipeline from station
+table to map at the first spacing, per stage through
+stage_timer.PipelineReport.  The epochs are placed at a fifth and four
+fifths of the synthetic series.  Results are written as JSON; pass an
+earlier result file with --compare to list the runs that got slower.
+
+Example
+-------
+    python benchmarks/run_benchmarks.py -o bench.json
+    python benchmarks/run_benchmarks.py -o new.json --compare bench.json
+"""
+
+import os
+import sys
+import json
+import shutil
+import argparse
+import platform
+import datetime
+import tempfile
+import subprocess
+
+here = os.path.dirname(os.path.abspath(__file__))
+top = os.path.dirname(here)
+for subdir in ("getDisplacement", "GPS_interpolation"):
+    sys.path.insert(0, os.path.join(top, subdir))
+
+import getDisplacementNGL
+from stage_timer import PipelineReport
+from synthetic_gnss import make_stations, write_archive
+from mock_server import MockDataServer
+
+REGION = {"lat": 33.0, "lon": -115.0, "width": 2.0, "height": 2.0}
+
+# First day of the synthetic series
+START = datetime.date(2005, 1, 1)
+
+# Shortest series that leaves the two averaging windows apart
+MIN_YEARS = 0.25
+
+COLUMNS = ["Site", "Lon", "Lat", "Delta E", "Delta N", "Delta V",
+           "Sigma E", "Sigma N", "Sigma V"]
+
+
+def _getParser():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-o", dest="output", default="benchmark_results.json",
+                        help="result json file")
+    parser.add_argument("--stations", type=int, nargs="+", default=[10, 40, 160],
+                        help="station counts to run")
+    parser.add_argument("--spacings", type=float, nargs="+", default=[0.05, 0.02, 0.01],
+                        help="interpolation grid spacings in degrees")
+    parser.add_argument("--centers", nargs="+", default=["JPL", "NGL"],
+                        help="analysis centers to run")
+    parser.add_argument("--years", type=float, default=10.0,
+                        help="length of the synthetic series in years")
+    parser.add_argument("--repeat", type=int, default=1,
+                        help="repeat each run and keep the fastest")
+    parser.add_argument("--trace-memory", action="store_true", dest="traceMemory",
+                        help="record peak memory per stage (slow)")
+    parser.add_argument("--skip-interpolation", action="store_true", dest="skipInterpolation",
+                        help="only time getDisplacement")
+    parser.add_argument("--skip-map", action="store_true", dest="skipMap",
+                        help="do not time create_map")
+    parser.add_argument("--workdir", default=None,
+                        help="keep synthetic data and outputs here instead of a temporary directory")
+    parser.add_argument("--compare", default=None,
+                        help="earlier result json to compare against")
+    parser.add_argument("--threshold", type=float, default=1.25,
+                        help="slowdown ratio reported as a regression")
+    return parser
+
+
+def _version():
+    try:
+        out = subprocess.run(["git", "-C", top, "describe", "--always", "--dirty"],
+                             stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                             check=True)
+        return out.stdout.decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def epochs(years):
+    """Epoch pair at a fifth and four fifths of a series of that length."""
+    def day(fraction):
+        return (START + datetime.timedelta(days=fraction * years * 365.25)).isoformat()
+    return day(0.2), day(0.8)
+
+
+def _best(runs, repeat):
+    """Call runs() repeat times and keep the (result, report) with the
+    smallest total wall time."""
+    best = None
+    for _ in range(repeat):
+        result, report = runs()
+        if best is None or report["total_wall_time"] < best[1]["total_wall_time"]:
+            best = (result, report)
+    return best
+
+
+def run_ladder(args, workdir):
+    runs = []
+    years = args.years
+    epoch1, epoch2 = epochs(years)
+    for count in args.stations:
+        root = os.path.join(workdir, "archive_{:d}_{:g}y".format(count, years))
+        if not os.path.isdir(root):
+            print("writing synthetic archive with {:d} stations".format(count))
+            write_archive(root, make_stations(count, **REGION), start=START,
+                          years=years, centers=args.centers)
+        with MockDataServer(root) as server:
+            getDisplacementNGL.dataSources = server.sources()
+            for center in args.centers:
+                parameters = {
+                    "lat": REGION["lat"], "lon": REGION["lon"],
+                    "width": REGION["width"], "height": REGION["height"],
+                    "epoch1": epoch1, "epoch2": epoch2,
+                    "output": os.path.join(workdir, "displacement"),
+                    "analysisCenter": center, "scale": None, "ref": None,
+                    "eon": True, "mon": False, "dwin1": None, "dwin2": None,
+                    "vabs": False,
+                }
+
+                def displacement():
+                    with PipelineReport(trace_memory=args.traceMemory) as report:
+                        table = getDisplacementNGL.getDisplacement(dict(parameters), report=report)
+                    return table, report.to_dict()
+
+                # getDisplacementNGL imports numpy and its helpers on first use;
+                # keep that out of the timed runs
+                getDisplacementNGL.getDisplacement(dict(parameters))
+                table, report = _best(displacement, args.repeat)
+                runs.append({"name": "getDisplacement/{:s}/{:d}".format(center, count),
+                             "center": center, "stations": count,
+                             "grid_spacing": None, **report})
+                print("{:40s} {:8.3f} s".format(runs[-1]["name"], report["total_wall_time"]))
+                if args.skipInterpolation:
+                    continue
+                if len(table) < 3:
+                    print("{:d} stations with data, too few to interpolate".format(len(table)))
+                    continue
+                runs.extend(run_interpolation(args, table, center, count))
+                runs.append(run_pipeline(args, parameters, center, count))
+    return runs
+
+
+def _interpolate_and_map(args, table, spacing, report):
+    import pandas as pd
+    from gps_interpolation import interpolate
+
+    df = pd.DataFrame(table, columns=COLUMNS)
+    grid = interpolate(df["Lon"], df["Lat"], grid_spacing=spacing, report=report,
+                       **df[["Delta E", "Delta N", "Delta V"]])
+    if not args.skipMap:
+        from create_map import create_map
+
+        create_map(grid, report=report)
+    return grid
+
+
+def run_interpolation(args, table, center, count):
+    # load pandas, pykrige and folium before the clock starts
+    _interpolate_and_map(args, table, args.spacings[0], None)
+    runs = []
+    for spacing in args.spacings:
+
+        def pipeline():
+            with PipelineReport(trace_memory=args.traceMemory) as report:
+                grid = _interpolate_and_map(args, table, spacing, report)
+            return grid, report.to_dict()
+
+        grid, report = _best(pipeline, args.repeat)
+        runs.append({"name": "interpolate/{:s}/{:d}/{:g}".format(center, count, spacing),
+                     "center": center, "stations": count, "grid_spacing": spacing,
+                     "grid_points": len(grid), **report})
+        print("{:40s} {:8.3f} s".format(runs[-1]["name"], report["total_wall_time"]))
+    return runs
+
+
+def run_pipeline(args, parameters, center, count):
+    """Time station table to map in one report, at the first grid spacing."""
+    spacing = args.spacings[0]
+
+    def pipeline():
+        with PipelineReport(trace_memory=args.traceMemory) as report:
+            table = getDisplacementNGL.getDisplacement(dict(parameters), report=report)
+            grid = _interpolate_and_map(args, table, spacing, report)
+        return grid, report.to_dict()
+
+    grid, report = _best(pipeline, args.repeat)
+    run = {"name": "pipeline/{:s}/{:d}/{:g}".format(center, count, spacing),
+           "center": center, "stations": count, "grid_spacing": spacing,
+           "grid_points": len(grid), **report}
+    print("{:40s} {:8.3f} s".format(run["name"], report["total_wall_time"]))
+    return run
+
+
+def compare(previous, current, threshold):
+    """Return (name, old, new) for every run at least threshold times slower."""
+    old = {run["name"]: run["total_wall_time"] for run in previous["runs"]}
+    slower = []
+    for run in current["runs"]:
+        if run["name"] in old and run["total_wall_time"] > threshold * old[run["name"]]:
+            slower.append((run["name"], old[run["name"]], run["total_wall_time"]))
+    return slower
+
+
+def main():
+    parser = _getParser()
+    args = parser.parse_args()
+    if args.years < MIN_YEARS:
+        parser.error("--years must be at least {:g}".format(MIN_YEARS))
+    workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix="gnss_bench_"))
+    os.makedirs(workdir, exist_ok=True)
+    # create_map reads the fault geojson and writes its contour pngs in the cwd
+    shutil.copy(os.path.join(top, "GPS_interpolation", "UCERF3_.geojson"), workdir)
+    cwd = os.getcwd()
+    output = os.path.abspath(args.output)
+    os.chdir(workdir)
+    try:
+        runs = run_ladder(args, workdir)
+    finally:
+        os.chdir(cwd)
+        if args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    results = {
+        "version": _version(),
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {"stations": args.stations, "spacings": args.spacings,
+                   "centers": args.centers, "years": args.years,
+                   "repeat": args.repeat, "region": REGION,
+                   "epochs": epochs(args.years)},
+        "runs": runs,
+    }
+    with open(output, "w") as outFile:
+        json.dump(results, outFile, indent=2)
+    print("results written to " + output)
+
+    if args.compare is not None:
+        with open(args.compare) as inFile:
+            slower = compare(json.load(inFile), results, args.threshold)
+        for name, before, after in slower:
+            print("REGRESSION {:40s} {:8.3f} s -> {:8.3f} s".format(name, before, after))
+        if slower:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
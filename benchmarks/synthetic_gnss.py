@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""
+Synthetic GNSS archives for offline benchmarking.
+
+Writes station tables and daily position series in the formats
+getDisplacementNGL.py reads from JPL and NGL:
+
+    <root>/jpl/table2.html          POS/VEL lines, longitudes in 0..360
+    <root>/jpl/series/SSSS.series   fractional year, E N U and sigmas in m
+    <root>/ngl/llh.out              site lat lon height
+    <root>/ngl/tenv3/SSSS.tenv3     one header line, 20 columns per epoch
+
+Every station moves with a smooth regional velocity field plus an annual
+term and white noise, so the displacement table and the interpolated grid
+look like the real thing.  Output is deterministic for a given seed.
+"""
+
+import os
+import math
+import random
+import datetime
+
+TENV3_HEADER = (
+    "site YYMMMDD yyyy.yyyy __MJD week d reflon _e0(m) __east(m) ____n0(m) "
+    "_north(m) u0(m) ____up(m) _ant(m) sig_e(m) sig_n(m) sig_u(m) __corr_en "
+    "__corr_eu __corr_nu"
+)
+
+_ALPHABET = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+
+
+def station_ids(count):
+    """Return ``count`` distinct four character station IDs."""
+    ids = []
+    for i in range(count):
+        code = ""
+        for _ in range(3):
+            code = _ALPHABET[i % 36] + code
+            i //= 36
+        ids.append("S" + code)
+    return ids
+
+
+def make_stations(count, lat=33.0, lon=-115.0, width=2.0, height=2.0, seed=0):
+    """
+    Scatter ``count`` stations uniformly over the box and give each one a
+    velocity in m/yr from a simple shear field across the box.
+
+    Returns a list of dicts with keys stn, lat, lon, hgt, ve, vn, vu.
+    """
+    rng = random.Random(seed)
+    stations = []
+    for stn in station_ids(count):
+        slat = lat + rng.uniform(-height / 2, height / 2)
+        slon = lon + rng.uniform(-width / 2, width / 2)
+        # right lateral shear across a fault through the box center
+        side = math.tanh((slon - lon) / (0.1 * width))
+        stations.append(
+            {
+                "stn": stn,
+                "lat": slat,
+                "lon": slon,
+                "hgt": rng.uniform(-50.0, 1500.0),
+                "ve": -0.004 + 0.001 * side,
+                "vn": 0.010 + 0.015 * side,
+                "vu": rng.gauss(0.0, 0.001),
+            }
+        )
+    return stations
+
+
+def _epochs(start, years):
+    """Daily epochs at noon as (datetime, fractional year, seconds past
+    2000-01-01) tuples, with the 365.25 day year getDisplacement uses."""
+    j2000 = datetime.datetime(2000, 1, 1)
+    day = datetime.datetime(start.year, start.month, start.day, 12)
+    for _ in range(int(round(years * 365.25))):
+        seconds = (day - j2000).total_seconds()
+        yield day, 2000.0 + seconds / (86400.0 * 365.25), seconds
+        day += datetime.timedelta(days=1)
+
+
+def _motion(station, t, t0, rng):
+    dt = t - t0
+    annual = 2.0 * math.pi * t
+    e = station["ve"] * dt + 0.0010 * math.sin(annual) + rng.gauss(0.0, 0.0010)
+    n = station["vn"] * dt + 0.0010 * math.cos(annual) + rng.gauss(0.0, 0.0012)
+    u = station["vu"] * dt + 0.0030 * math.sin(annual) + rng.gauss(0.0, 0.0040)
+    return e, n, u
+
+
+def write_jpl_series(filename, station, start, years, seed=0):
+    rng = random.Random("{}-{}".format(seed, station["stn"]))
+    t0 = None
+    with open(filename, "w") as outFile:
+        for day, t, seconds in _epochs(start, years):
+            if t0 is None:
+                t0 = t
+            e, n, u = _motion(station, t, t0, rng)
+            print(
+                "{:.8f} {:16.6f} {:16.6f} {:16.6f} {:16.6f} {:16.6f} {:16.6f} "
+                "{:16.6f} {:16.6f} {:16.6f} {:16.2f} {:5d} {:2d} {:2d} {:2d} "
+                " 0  0".format(
+                    t, e, n, u, 0.0010, 0.0012, 0.0040, 0.05, -0.2, -0.2,
+                    seconds, day.year, day.month, day.day, day.hour,
+                ),
+                file=outFile,
+            )
+
+
+def write_ngl_series(filename, station, start, years, seed=0):
+    rng = random.Random("{}-{}".format(seed, station["stn"]))
+    t0 = None
+    mjd0 = datetime.datetime(1858, 11, 17)
+    gps0 = datetime.datetime(1980, 1, 6)
+    reflon = round(station["lon"], 1)
+    with open(filename, "w") as outFile:
+        print(TENV3_HEADER, file=outFile)
+        for day, t, seconds in _epochs(start, years):
+            if t0 is None:
+                t0 = t
+            e, n, u = _motion(station, t, t0, rng)
+            gpsdays = (day - gps0).days
+            print(
+                "{:s} {:s} {:.4f} {:5d} {:4d} {:1d} {:6.1f} {:6d} {:9.6f} "
+                "{:9d} {:9.6f} {:5d} {:9.6f} {:.4f} {:.6f} {:.6f} {:.6f} "
+                "{:9.6f} {:9.6f} {:9.6f}".format(
+                    station["stn"], day.strftime("%y%b%d").upper(), t,
+                    (day - mjd0).days, gpsdays // 7, gpsdays % 7, reflon,
+                    0, e, 0, n, 0, u, 0.0, 0.0010, 0.0012, 0.0040,
+                    -0.09, 0.14, -0.34,
+                ),
+                file=outFile,
+            )
+
+
+def write_archive(root, stations, start=datetime.date(2005, 1, 1), years=10.0,
+                  centers=("JPL", "NGL"), seed=0):
+    """
+    Write tables and series for ``stations`` under ``root`` for the given
+    analysis centers.  Returns the root directory.
+    """
+    if "JPL" in centers:
+        os.makedirs(os.path.join(root, "jpl", "series"), exist_ok=True)
+        with open(os.path.join(root, "jpl", "table2.html"), "w") as outFile:
+            print("<pre>", file=outFile)
+            print("Station positions and velocities (synthetic)", file=outFile)
+            for station in stations:
+                print(
+                    "{:s} POS {:12.5f} {:12.5f} {:10.3f} {:7.3f} {:7.3f} {:7.3f}".format(
+                        station["stn"], station["lat"], station["lon"] % 360.0,
+                        station["hgt"], 0.001, 0.001, 0.003,
+                    ),
+                    file=outFile,
+                )
+                print(
+                    "{:s} VEL {:10.4f} {:10.4f} {:10.4f} {:7.4f} {:7.4f} {:7.4f}".format(
+                        station["stn"], station["vn"], station["ve"],
+                        station["vu"], 0.0001, 0.0001, 0.0003,
+                    ),
+                    file=outFile,
+                )
+            print("</pre>", file=outFile)
+        for station in stations:
+            write_jpl_series(
+                os.path.join(root, "jpl", "series", station["stn"] + ".series"),
+                station, start, years, seed,
+            )
+    if "NGL" in centers:
+        os.makedirs(os.path.join(root, "ngl", "tenv3"), exist_ok=True)
+        with open(os.path.join(root, "ngl", "llh.out"), "w") as outFile:
+            for station in stations:
+                print(
+                    "{:s} {:12.7f} {:13.7f} {:10.3f}".format(
+                        station["stn"], station["lat"], station["lon"],
+                        station["hgt"],
+                    ),
+                    file=outFile,
+                )
+        for station in stations:
+            write_ngl_series(
+                os.path.join(root, "ngl", "tenv3", station["stn"] + ".tenv3"),
+                station, start, years, seed,
+            )
+    return root
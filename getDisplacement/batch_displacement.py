@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+**PROGRAM**
+    batch_displacement.py
+
+**PURPOSE**
+    Run getDisplacement for many regions, epoch pairs and analysis centers
+    in one process pool, for nightly product generation.
+
+    The station table of each center is downloaded once and handed to every
+    worker.  Jobs on the same center and region run in the same worker so
+    their series are fetched once and shared from memory; with --store the
+    series are also kept on disk and refreshed incrementally between runs.
+    Each job writes its usual kml and table files under the output
+    directory, named after the job, and summary.json lists every job with
+    its status.
+
+**MANIFEST**
+    YAML (needs PyYAML) with optional defaults, explicit jobs and/or the
+    product of regions x epochs x centers::
+
+        defaults: {dwin1: 10, dwin2: 10, eon: true}
+        regions:
+          - {name: saltonsea, lat: 33.2, lon: -115.7, width: 1.6, height: 1.4}
+          - {name: ridgecrest, lat: 35.7, lon: -117.6, width: 1.6, height: 1.4}
+        epochs:
+          - [2019-07-01, 2019-07-10]
+        centers: [JPL, NGL]
+        jobs:
+          - {name: la, lat: 34.0, lon: -118.2, width: 1.6, height: 1.0,
+             epoch1: 2010-04-01, epoch2: 2020-04-01, center: NGL}
+
+    or CSV with one job per row and a header naming the columns, e.g.::
+
+        name,lat,lon,width,height,epoch1,epoch2,center,ref
+        saltonsea,33.2,-115.7,1.6,1.4,2019-07-01,2019-07-10,JPL,
+
+    Columns: name, lat, lon, width, height, epoch1, epoch2, center, ref,
+    scale, dwin1, dwin2, eon, mon, vabs, estimator.  Empty cells take the
+    defaults.
+
+**EXAMPLE**
+    batch_displacement.py jobs.yaml -o products -j 4 --store seriesdir
+"""
+
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+import datetime
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+
+from getDisplacementNGL import getDisplacement, readStationTable
+from series_store import SeriesStore, fetch_series
+from result_cache import ResultCache
+from stage_timer import PipelineReport
+from epoch_estimators import ESTIMATORS
+
+JOB_FIELDS = ("name", "lat", "lon", "width", "height", "epoch1", "epoch2",
+              "center", "ref", "scale", "dwin1", "dwin2", "eon", "mon", "vabs",
+              "estimator")
+
+_BOOLEAN = ("eon", "mon", "vabs")
+
+
+class SharedSeries:
+    """
+    Series source for getDisplacement(store=...) that remembers every series
+    it returned, so jobs over the same stations fetch each one once.  Series
+    come from an optional SeriesStore, else straight from the server.
+    """
+
+    def __init__(self, store=None):
+        self.store = store
+        self.series = {}
+
+    def get(self, center, stn, url, report=None):
+        key = (center, stn)
+        if key not in self.series:
+            if self.store is not None:
+                self.series[key] = self.store.get(center, stn, url, report=report)
+            else:
+                self.series[key] = fetch_series(url, center, report=report)
+        return self.series[key]
+
+
+def _text(value):
+    """Manifest value as a string for getDisplacement, None when blank."""
+    if value is None:
+        return None
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.strftime("%Y-%m-%d")
+    value = str(value).strip()
+    return value or None
+
+
+def _flag(value):
+    if isinstance(value, bool):
+        return value
+    return _text(value) is not None and _text(value).lower() in ("1", "true", "yes", "y")
+
+
+def _job(fields, defaults):
+    job = dict(defaults)
+    job.update({k: v for k, v in fields.items() if _text(v) is not None})
+    unknown = sorted(set(job) - set(JOB_FIELDS))
+    if unknown:
+        raise ValueError("unknown job fields: " + ", ".join(unknown))
+    for field in ("lat", "lon", "width", "height", "epoch1", "epoch2"):
+        if _text(job.get(field)) is None:
+            raise ValueError("job {} has no {}".format(job.get("name"), field))
+    clean = {field: _text(job.get(field)) for field in JOB_FIELDS if field not in _BOOLEAN}
+    clean.update({field: _flag(job.get(field)) for field in _BOOLEAN})
+    clean["center"] = (clean["center"] or "JPL").upper()
+    if clean["center"] not in ("JPL", "NGL"):
+        raise ValueError("job {} has center {}; only JPL,NGL are supported".format(
+            clean["name"], clean["center"]))
+    if clean["estimator"] not in (None,) + ESTIMATORS:
+        raise ValueError("job {} has estimator {}; only {} are supported".format(
+            clean["name"], clean["estimator"], ",".join(ESTIMATORS)))
+    if clean["name"] is None:
+        clean["name"] = "{lat}_{lon}".format(**clean)
+    clean["name"] = "{}_{}_{}_{}".format(clean["name"], clean["center"],
+                                        clean["epoch1"], clean["epoch2"])
+    return clean
+
+
+def readManifest(filename):
+    """Return the list of jobs described by a YAML or CSV manifest."""
+    if filename.lower().endswith((".yaml", ".yml")):
+        try:
+            import yaml
+        except ImportError:
+            raise ImportError("PyYAML is needed to read {}; use a CSV manifest "
+                              "or install pyyaml".format(filename))
+        with open(filename) as inFile:
+            manifest = yaml.safe_load(inFile) or {}
+        defaults = manifest.get("defaults", {})
+        jobs = [_job(fields, defaults) for fields in manifest.get("jobs", [])]
+        for region in manifest.get("regions", []):
+            for epoch1, epoch2 in manifest.get("epochs", []):
+                for center in manifest.get("centers", ["JPL"]):
+                    fields = dict(region, epoch1=epoch1, epoch2=epoch2, center=center)
+                    jobs.append(_job(fields, defaults))
+    else:
+        with open(filename, newline="") as inFile:
+            jobs = [_job(row, {}) for row in csv.DictReader(inFile)]
+    names = [job["name"] for job in jobs]
+    if len(set(names)) != len(names):
+        raise ValueError("job names in {} are not unique".format(filename))
+    return jobs
+
+
+# Worker state, set once per process by _initWorker
+_worker = {}
+
+
+def _initWorker(tables, storeRoot, cacheRoot, outdir, timing):
+    _worker["tables"] = tables
+    _worker["series"] = SharedSeries(SeriesStore(storeRoot) if storeRoot else None)
+    _worker["cache"] = ResultCache(cacheRoot) if cacheRoot else None
+    _worker["outdir"] = outdir
+    _worker["timing"] = timing
+
+
+def _runJob(job):
+    output = os.path.join(_worker["outdir"], job["name"])
+    parameters = {
+        "lat": job["lat"], "lon": job["lon"], "width": job["width"],
+        "height": job["height"], "epoch1": job["epoch1"], "epoch2": job["epoch2"],
+        "output": output, "analysisCenter": job["center"], "scale": job["scale"],
+        "ref": job["ref"], "eon": job["eon"], "mon": job["mon"],
+        "dwin1": job["dwin1"], "dwin2": job["dwin2"], "vabs": job["vabs"],
+        "estimator": job["estimator"],
+    }
+    summary = {"name": job["name"], "job": job}
+    start = time.time()
+    report = PipelineReport() if _worker["timing"] else None
+    try:
+        data_table = getDisplacement(parameters, report=report,
+                                     store=_worker["series"], cache=_worker["cache"],
+                                     fileLines=_worker["tables"][job["center"]])
+        summary["status"] = "ok"
+        summary["stations"] = len(data_table)
+        summary["outputs"] = [output + suffix for suffix in
+                              ("_horizontal.kml", "_vertical.kml", "_table.txt")]
+    except Exception:
+        summary["status"] = "error"
+        summary["error"] = traceback.format_exc()
+    summary["elapsed"] = time.time() - start
+    if report is not None:
+        report.close()
+        summary["timing"] = report.to_dict()
+    return summary
+
+
+def _runGroup(jobs):
+    # series are only shared within a group; drop the previous group's
+    _worker["series"].series.clear()
+    return [_runJob(job) for job in jobs]
+
+
+def runBatch(jobs, outdir, workers=None, storeRoot=None, cacheRoot=None, timing=False):
+    """
+    Run the jobs over a process pool and write outdir/summary.json.
+    Returns the per-job summaries in manifest order.
+    """
+    os.makedirs(outdir, exist_ok=True)
+    start = time.time()
+    tables = {}
+    for center in sorted(set(job["center"] for job in jobs)):
+        tables[center] = readStationTable(center)
+
+    # jobs on the same center and box share their series in one worker
+    groups = {}
+    for job in jobs:
+        key = (job["center"], job["lat"], job["lon"], job["width"], job["height"])
+        groups.setdefault(key, []).append(job)
+
+    summaries = {}
+    initargs = (tables, storeRoot, cacheRoot, outdir, timing)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_initWorker,
+                             initargs=initargs) as pool:
+        for done in pool.map(_runGroup, groups.values()):
+            for summary in done:
+                summaries[summary["name"]] = summary
+                print("{:60s} {:6s} {:8.2f} s".format(summary["name"], summary["status"],
+                                                     summary["elapsed"]))
+    ordered = [summaries[job["name"]] for job in jobs]
+
+    with open(os.path.join(outdir, "summary.json"), "w") as outFile:
+        json.dump({
+            "created": datetime.datetime.now().isoformat(timespec="seconds"),
+            "elapsed": time.time() - start,
+            "jobs": ordered,
+        }, outFile, indent=2)
+    return ordered
+
+
+def _getParser():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('manifest', help='job manifest (.yaml/.yml or .csv)')
+    parser.add_argument('-o', action='store', dest='outdir', required=True, help='output directory')
+    parser.add_argument('-j', action='store', dest='workers', type=int, required=False, help='number of worker processes')
+    parser.add_argument('--store', action='store', dest='store', required=False, help='series store directory shared by all jobs')
+    parser.add_argument('--cache', action='store', dest='cache', required=False, help='result cache directory')
+    parser.add_argument('--timing', action='store_true', dest='timing', required=False, help='add per-stage timing to the summary')
+    return parser
+
+
+def main():
+    results = _getParser().parse_args()
+    jobs = readManifest(results.manifest)
+    summaries = runBatch(jobs, results.outdir, workers=results.workers,
+                         storeRoot=results.store, cacheRoot=results.cache,
+                         timing=results.timing)
+    failed = [summary["name"] for summary in summaries if summary["status"] != "ok"]
+    print("{:d} jobs, {:d} failed; summary in {}".format(
+        len(summaries), len(failed), os.path.join(results.outdir, "summary.json")))
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+**PROGRAM**
+    center_fusion.py
+
+**PURPOSE**
+    Compute JPL and NGL displacements for the same region and epochs in one
+    pass and align them station by station, for comparing the two solutions.
+
+    Both centers are fetched and computed concurrently.  Stations are
+    joined by ID when both centers place them within --tolerance degrees of
+    each other, and the remaining stations by location alone (the nearest
+    station within the tolerance), so monuments named differently by the
+    two centers still line up.  The aligned rows go to <output>_fused.txt
+    with both solutions and their difference (JPL - NGL).  With --combine
+    the inverse-variance weighted combination of the two is also written
+    as the usual kml and table files.
+
+    Takes the same options as getDisplacementNGL.py; -c is ignored.
+
+**EXAMPLE**
+    center_fusion.py --lat 33 --lon -115 --width 2 --height 2 -t1 2019-07-01 -t2 2019-07-10 --combine -o saltonsea
+"""
+
+import math
+from concurrent.futures import ThreadPoolExecutor
+
+import getDisplacementNGL
+from getDisplacementNGL import centerSettings, displacementTable, getSettings, objdict, writeOutput
+from series_store import SeriesStore
+from result_cache import ResultCache
+from stage_timer import PipelineReport, stage
+
+CENTERS = ("JPL", "NGL")
+
+# Degrees in lat and lon within which two stations are taken to be the same
+TOLERANCE = 0.002
+
+_VALUES = ("dE", "dN", "dV", "sE", "sN", "sV")
+
+FUSED_FIELDS = (("JPL site", "NGL site", "Lon", "Lat")
+                + tuple("JPL " + v for v in _VALUES)
+                + tuple("NGL " + v for v in _VALUES)
+                + tuple("Diff " + v for v in _VALUES))
+
+COMBINED_FIELDS = tuple("Comb " + v for v in _VALUES)
+
+
+def centerTables(settings, report=None, store=None, cache=None, tables=None):
+    """
+    Return {center: rows} for JPL and NGL computed concurrently with the
+    settings of getSettings.  tables may hold already fetched station
+    tables per center.  The stages of each center are added to report
+    prefixed with the center name; when report profiles or traces memory
+    the centers run one after the other, as cProfile and tracemalloc only
+    follow one thread.
+    """
+    tables = tables or {}
+
+    def run(center):
+        own = PipelineReport(trace_memory=report.trace_memory) if report is not None else None
+        rows = displacementTable(centerSettings(settings, center), own,
+                                 store, cache, tables.get(center))
+        return rows, own
+
+    if report is not None and (report.trace_memory or report.profile_dir is not None):
+        outcomes = {center: run(center) for center in CENTERS}
+    else:
+        with ThreadPoolExecutor(max_workers=len(CENTERS)) as pool:
+            futures = {center: pool.submit(run, center) for center in CENTERS}
+        outcomes = {center: future.result() for center, future in futures.items()}
+    results = {}
+    for center, (rows, own) in outcomes.items():
+        if own is not None:
+            own.close()
+            report.merge(own, center + " ")
+        results[center] = rows
+    return results
+
+
+def _near(rowA, rowB, tolerance):
+    return abs(rowA[1] - rowB[1]) <= tolerance and abs(rowA[2] - rowB[2]) <= tolerance
+
+
+def _distance(rowA, rowB):
+    dlon = (rowA[1] - rowB[1]) * math.cos(rowA[2] * math.pi / 180.)
+    return math.hypot(dlon, rowA[2] - rowB[2])
+
+
+def _cell(row, tolerance):
+    return int(math.floor(row[1] / tolerance)), int(math.floor(row[2] / tolerance))
+
+
+def matchStations(rowsA, rowsB, tolerance=TOLERANCE):
+    """
+    Return (i, j) index pairs of rowsA and rowsB that are the same station:
+    first by ID when the locations agree within tolerance, then the
+    remaining rows by nearest location within tolerance, found through a
+    grid index with tolerance-sized cells.
+    """
+    byId = {row[0]: j for j, row in enumerate(rowsB)}
+    pairs = []
+    usedA, usedB = set(), set()
+    for i, row in enumerate(rowsA):
+        j = byId.get(row[0])
+        if j is not None and _near(row, rowsB[j], tolerance):
+            pairs.append((i, j))
+            usedA.add(i)
+            usedB.add(j)
+
+    index = {}
+    for j, row in enumerate(rowsB):
+        if j not in usedB:
+            index.setdefault(_cell(row, tolerance), []).append(j)
+    for i, row in enumerate(rowsA):
+        if i in usedA:
+            continue
+        x, y = _cell(row, tolerance)
+        candidates = [j for dx in (-1, 0, 1) for dy in (-1, 0, 1)
+                      for j in index.get((x + dx, y + dy), [])
+                      if j not in usedB and _near(row, rowsB[j], tolerance)]
+        if candidates:
+            j = min(candidates, key=lambda j: _distance(row, rowsB[j]))
+            pairs.append((i, j))
+            usedB.add(j)
+    return sorted(pairs)
+
+
+def _combine(a, b):
+    """Inverse-variance combination of two value/sigma sets (dE,dN,dV,sE,sN,sV)."""
+    values, sigmas = [], []
+    for k in range(3):
+        wa, wb = 1 / a[k + 3] ** 2, 1 / b[k + 3] ** 2
+        values.append((a[k] * wa + b[k] * wb) / (wa + wb))
+        sigmas.append(1 / math.sqrt(wa + wb))
+    return values + sigmas
+
+
+def fuseTables(tables, tolerance=TOLERANCE, combine=False):
+    """
+    Align the JPL and NGL rows of centerTables.  Returns the fused rows
+    (FUSED_FIELDS, then COMBINED_FIELDS when combine is set) and
+    {center: station IDs without a counterpart}.
+    """
+    rowsA, rowsB = tables["JPL"], tables["NGL"]
+    pairs = matchStations(rowsA, rowsB, tolerance)
+    fused = []
+    for i, j in pairs:
+        a, b = rowsA[i][3:], rowsB[j][3:]
+        diff = [a[k] - b[k] for k in range(3)]
+        diff += [math.sqrt(a[k] ** 2 + b[k] ** 2) for k in range(3, 6)]
+        row = [rowsA[i][0], rowsB[j][0], rowsA[i][1], rowsA[i][2]] + list(a) + list(b) + diff
+        if combine:
+            row += _combine(a, b)
+        fused.append(row)
+    matchedA = set(i for i, _ in pairs)
+    matchedB = set(j for _, j in pairs)
+    unmatched = {
+        "JPL": [row[0] for i, row in enumerate(rowsA) if i not in matchedA],
+        "NGL": [row[0] for j, row in enumerate(rowsB) if j not in matchedB],
+    }
+    return fused, unmatched
+
+
+def writeFused(filename, fused, combine=False):
+    """Write the fused rows as a fixed-width table with a header line."""
+    fields = FUSED_FIELDS + (COMBINED_FIELDS if combine else ())
+    with open(filename, "w") as outFile:
+        print("{:9s} {:9s}".format(*fields[:2]) + "".join(" {:>12s}".format(f) for f in fields[2:]),
+              file=outFile)
+        for row in fused:
+            print("{:9s} {:9s}".format(*row[:2]) + "".join(" {:12f}".format(v) for v in row[2:]),
+                  file=outFile)
+
+
+def fuseDisplacement(results, report=None, store=None, cache=None, tables=None,
+                     combine=False, tolerance=TOLERANCE):
+    """
+    Compute both centers for the region and epochs of results (command line
+    results or the equivalent dict), write <output>_fused.txt and, with
+    combine, the kml and table files of the combined solution.  Returns the
+    fused rows and the unmatched stations as fuseTables does.
+    """
+    if type(results) is dict:
+        results = objdict(results)
+    settings = getSettings(results)
+
+    with stage(report, "center_fusion") as record:
+        centers = centerTables(settings, report, store, cache, tables)
+        with stage(report, "match_stations"):
+            fused, unmatched = fuseTables(centers, tolerance, combine)
+        with stage(report, "write_output"):
+            writeFused(settings.output + "_fused.txt", fused, combine)
+            if combine:
+                combined = [[row[0], row[2], row[3]] + row[-6:] for row in fused]
+                writeOutput(objdict(settings, analysisCenter="JPL"), combined)
+        record.stations += len(fused)
+    return fused, unmatched
+
+
+def _getParser():
+    parser = getDisplacementNGL._getParser()
+    parser.description = __doc__
+    parser.epilog = None
+    parser.add_argument('--combine', action='store_true', dest='combine', required=False,
+                        help='also write the inverse-variance combination as kml and table files')
+    parser.add_argument('--tolerance', action='store', dest='tolerance', type=float, default=TOLERANCE,
+                        help='degrees within which stations of both centers are matched')
+    return parser
+
+
+def main():
+    results = _getParser().parse_args()
+    store = SeriesStore(results.store) if results.store else None
+    cache = ResultCache(results.cache) if results.cache else None
+    report = None
+    if results.timing or results.profile or results.traceMemory:
+        report = PipelineReport(trace_memory=results.traceMemory, profile_dir=results.profile)
+    fused, unmatched = fuseDisplacement(results, report=report, store=store, cache=cache,
+                                        combine=results.combine, tolerance=results.tolerance)
+    print("{:d} stations in both centers; {:d} only in JPL, {:d} only in NGL".format(
+        len(fused), len(unmatched["JPL"]), len(unmatched["NGL"])))
+    if report is not None:
+        report.close()
+        report.print_summary()
+        if results.timing:
+            report.save(results.timing)
+
+
+if __name__ == "__main__":
+    main()
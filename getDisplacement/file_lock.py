@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+"""
+Advisory lock files, so processes sharing a series store or result cache
+(batch_displacement.py workers, or runs started side by side) do not
+update the same station or cache entry at the same time.
+
+Locks use fcntl.flock and are released when the holding process exits,
+even if it crashes.  Where fcntl is missing (Windows) locking is skipped
+and concurrent writers are not protected.
+"""
+
+import os
+import contextlib
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+@contextlib.contextmanager
+def locked(filename):
+    """Hold an exclusive lock on filename + '.lock' while the block runs."""
+    if fcntl is None:
+        yield
+        return
+    handle = os.open(filename + ".lock", os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(handle, fcntl.LOCK_EX)
+        yield
+    finally:
+        # closing the descriptor releases the lock
+        os.close(handle)
@@ -37,11 +37,38 @@ import os
 import sys
 import math
 import time
-import datetime
 import calendar
 import argparse
 import subprocess
-import urllib.request
+
+from stage_timer import PipelineReport, stage
+from result_cache import ResultCache
+
+# urllib.request, numpy and the modules built on numpy (series_store,
+# epoch_estimators) are imported where data is fetched or computed, so
+# --help and argument errors stay fast.
+
+# Series fetched at the same time for one region; fetching is mostly
+# waiting on the server
+fetchThreads = 8
+
+# Names of epoch_estimators.ESTIMATORS, repeated here for the same reason
+estimatorNames = ("wmean", "mad", "trend")
+
+# Station tables and time series per analysis center.  The series entry is a
+# format string taking the station ID.  Point these at another server (a
+# mirror, or the mock server in benchmarks/) to run without JPL/NGL.
+dataSources = {
+    "JPL": {
+        "table": 'https://sideshow.jpl.nasa.gov/post/tables/table2.html',
+        "series": 'https://sideshow.jpl.nasa.gov/pub/JPL_GPS_Timeseries/'
+                  'repro2018a/post/point/{:s}.series',
+    },
+    "NGL": {
+        "table": 'http://geodesy.unr.edu/NGLStationPages/llh.out',
+        "series": 'http://geodesy.unr.edu/gps_timeseries/tenv3/IGS14/{:s}.tenv3',
+    },
+}
 
 class LocationItem():
    def __init__(self,line,center):
@@ -64,31 +91,17 @@ class LocationItem():
         else:
            self.stn = False
       
-class SeriesItem():
-    def __init__(self,series,center):
-      """
-      Extract items from proper columns of line of time series.
-      For JPL (position in m, see "methods" link at JPL GNSS Time Series site):
-      Columns 1-3 (from 0 ) : East(m) North(m) Vert(m) 
-      Columns 4-6             E_sig(m) N_sig(m) V_sig(m)
-
-      1994.00136893         0.877450        -0.309555         0.011551         0.000609         0.000682         0.002465         0.048078        -0.202782        -0.234850    -189302400.00  1994  1  1 12  0  0
-      For NGL:
-      site YYMMMDD yyyy.yyyy __MJD week d reflon _e0(m) __east(m) ____n0(m) _north(m) u0(m) ____up(m) _ant(m) sig_e(m) sig_n(m) sig_u(m) __corr_en __corr_eu __corr_nu
-      USC1 96JAN01 1996.0000 50083  834 2 -118.3   1375  0.510258   3766317  0.946300    21  0.941326  0.0614 0.000863 0.001028 0.004216 -0.094302  0.146021 -0.340417
-      """
-
-      ix = series.split() 
-      if center == "JPL":
-         self.fracYr = ix[0]
-         self.ePos,self.nPos,self.uPos = ix[1],ix[2],ix[3]
-         self.eSig,self.nSig,self.uSig = ix[4],ix[5],ix[6]
-     
-      if center == "NGL": 
-         self.fracYr = ix[2]
-         m2mm = 1000.
-         self.ePos,self.nPos,self.uPos = ix[8],  ix[10], ix[12]
-         self.eSig,self.nSig,self.uSig = ix[14], ix[15], ix[16]
+def readSeries(stn,center,store,report):
+    '''
+    Return the series of a station as columns (see series_store.FIELDS),
+    refreshed incrementally through store when one is given
+    '''
+    from series_store import fetch_series
+
+    path = dataSources[center]["series"].format(stn)
+    if store != None:
+        return store.get(center,stn,path,report=report)
+    return fetch_series(path,center,report=report)
 
 def runCmd(cmd):
     '''run a command'''
@@ -119,6 +132,12 @@ def _getParser():
     parser.add_argument('--dwin1', action='store',dest='dwin1',required=False,help='specify averaging window in days')
     parser.add_argument('--dwin2', action='store',dest='dwin2',required=False,help='specify averaging window in days')
     parser.add_argument('--vabs', action='store_true',dest='vabs',required=False,help='display absolute verticals')
+    parser.add_argument('--estimator', action='store',dest='estimator',choices=estimatorNames,required=False,help='position estimate within the averaging windows: wmean (default), mad (outliers rejected) or trend (line fit at the epoch)')
+    parser.add_argument('--store', action='store',dest='store',required=False,help='keep series in this directory and only fetch new epochs on later runs')
+    parser.add_argument('--cache', action='store',dest='cache',required=False,help='reuse results cached in this directory while the size and date of their station table and series are unchanged (a day when those are unknown)')
+    parser.add_argument('--timing', action='store',dest='timing',required=False,help='write per-stage timing report to this json file')
+    parser.add_argument('--trace-memory', action='store_true',dest='traceMemory',required=False,help='record peak memory per stage (slow)')
+    parser.add_argument('--profile', action='store',dest='profile',required=False,help='dump cProfile stats into this directory')
     return parser
 
 # turn dict object to a class object
@@ -144,412 +163,512 @@ def main():
     # Read command line arguments
     parser = _getParser()
     results = parser.parse_args()
-    getDisplacement(results)
-
-def getDisplacement(results):
+    store = None
+    if (results.store != None):
+        from series_store import SeriesStore
+        store = SeriesStore(results.store)
+    cache = None
+    if (results.cache != None):
+        cache = ResultCache(results.cache)
+    if ((results.timing == None) & (results.profile == None) & (results.traceMemory != True)):
+        getDisplacement(results,store=store,cache=cache)
+        return
+    with PipelineReport(trace_memory=results.traceMemory,profile_dir=results.profile) as report:
+        getDisplacement(results,report=report,store=store,cache=cache)
+    report.print_summary()
+    if (results.timing != None):
+        report.save(results.timing)
+
+def getDisplacement(results, report=None, store=None, cache=None, fileLines=None):
+    '''
+    Compute displacements between two epochs for all stations in the region,
+    write the kml and table files and return the table rows.
+    Pass a stage_timer.PipelineReport as report to collect per-stage timing,
+    a series_store.SeriesStore as store to refresh series incrementally,
+    a result_cache.ResultCache as cache to reuse earlier results and the
+    lines of an already fetched station table as fileLines.
+    '''
 
     if (type(results) is dict):
         results = objdict(results)
+    settings = getSettings(results)
+
+    with stage(report, "getDisplacement") as record:
+        data_table = displacementTable(settings, report, store, cache, fileLines)
+        with stage(report, "write_output"):
+            writeOutput(settings, data_table)
+        record.stations += len(data_table)
+    return data_table
+
+def displacementTable(settings, report=None, store=None, cache=None, fileLines=None):
+    '''
+    Return the table rows for settings from cache when it holds them,
+    else compute them (and add them to cache)
+    '''
+    data_table = None
+    checked = {}
+
+    def check(urls):
+        checked.update(sourceStamps(urls, report))
+        return checked
+
+    if (cache != None):
+        with stage(report, "cache_lookup"):
+            data_table = cache.lookup(settings, check)
+    if (data_table == None):
+        stamps = None
+        locations = None
+        if (cache != None):
+            # stamped before computing: data changing meanwhile fails the
+            # next lookup.  Stamps just checked by the lookup are reused.
+            if (fileLines == None):
+                fileLines = readStationTable(settings.analysisCenter, report)
+            locations = sourceLocations(settings, fileLines)
+            stamps = {url: checked[url] for url in locations if url in checked}
+            missing = [url for url in locations if url not in checked]
+            if (len(missing) > 0):
+                stamps.update(sourceStamps(missing, report))
+        data_table = computeDisplacement(settings, report, store, fileLines)
+        if (cache != None):
+            cache.insert(settings, data_table, stamps, locations)
+    return data_table
+
+def epochYear(epoch):
+    '''Date given as YYYY-MM-DD in years since 2000 of 365.25 days, plus 2000'''
+    ntime = time.strptime(epoch,"%Y-%m-%d")
+    jtime = time.strptime("2000JAN01","%Y%b%d")
+    ytime = float(calendar.timegm(ntime)-calendar.timegm(jtime))
+    ytime = ytime/(86400.*365.25)
+    return ytime + 2000.
+
+def getSettings(results):
+    '''
+    Turn command line results (or the equivalent dict) into the bounds,
+    averaging windows, epochs and display options used by the computation
+    and the kml writer
+    '''
+    settings = objdict()
 
     # Set bounds
-    latmin = float(results.lat) - float(results.height)/2
-    latmax = float(results.lat) + float(results.height)/2
-    lonmin = float(results.lon) - float(results.width)/2
-    lonmax = float(results.lon) + float(results.width)/2
+    settings.latmin = float(results.lat) - float(results.height)/2
+    settings.latmax = float(results.lat) + float(results.height)/2
+    settings.lonmin = float(results.lon) - float(results.width)/2
+    settings.lonmax = float(results.lon) + float(results.width)/2
 
     # Set scale
-    scale = 320 
+    settings.scale = 320 
     if (results.scale != None):
-        scale = float(results.scale)
+        settings.scale = float(results.scale)
 
     # Set marker size
     if (results.mon == True):
-        msize = 0.2
+        settings.msize = 0.2
     else:
-        msize = 0.5
+        settings.msize = 0.5
     
     # Set analysis center
     if (results.analysisCenter != None):
-       analysisCenter = results.analysisCenter
+       settings.analysisCenter = results.analysisCenter
     else: #default
-       analysisCenter = "JPL"
+       settings.analysisCenter = "JPL"
+
+    # Set data sources; results from other sources (a mirror, the mock
+    # server) are cached apart
+    sources = dataSources.get(settings.analysisCenter, {})
+    settings.tableSource = sources.get("table")
+    settings.seriesSource = sources.get("series")
 
     # Set averaging window
-    dwin1 = 10./365.25/2. 
-    dwin2 = 10./365.25/2. 
+    settings.dwin1 = 10./365.25/2. 
+    settings.dwin2 = 10./365.25/2. 
     if (results.dwin1 != None):
-        dwin1 = float(results.dwin1)/365.25/2.
+        settings.dwin1 = float(results.dwin1)/365.25/2.
     if (results.dwin2 != None):
-        dwin2 = float(results.dwin2)/365.25/2.
-
-    # Set first epoch
-    if (len(results.epoch1) == 10):
-        results.epoch1 = datetime.datetime.strptime(results.epoch1,"%Y-%m-%d").strftime("%y%b%d").upper()
-        ntime = time.strptime(results.epoch1,"%y%b%d")
-        jtime = time.strptime("2000JAN01","%Y%b%d")
-        ytime1 = float(calendar.timegm(ntime)-calendar.timegm(jtime))
-        ytime1 = ytime1/(86400.*365.25)
-        ytime1 = ytime1 + 2000.
-
-    # Set second epoch
-    if (len(results.epoch2) == 10):
-        results.epoch2 = datetime.datetime.strptime(results.epoch2,"%Y-%m-%d").strftime("%y%b%d").upper()
-        ntime = time.strptime(results.epoch2,"%y%b%d")
-        jtime = time.strptime("2000JAN01","%Y%b%d")
-        ytime2 = float(calendar.timegm(ntime)-calendar.timegm(jtime))
-        ytime2 = ytime2/(86400.*365.25)
-        ytime2 = ytime2 + 2000.
+        settings.dwin2 = float(results.dwin2)/365.25/2.
 
-    # Read table of positions
-    if analysisCenter == "JPL":
-       response1 = urllib.request.urlopen(\
-          'https://sideshow.jpl.nasa.gov/post/tables/table2.html')
-       fileLines = response1.read().decode('utf-8').splitlines()
+    # Set epochs
+    settings.epoch1 = results.epoch1
+    settings.epoch2 = results.epoch2
+    settings.ytime1 = epochYear(results.epoch1)
+    settings.ytime2 = epochYear(results.epoch2)
 
-    elif analysisCenter == "NGL":
-       response1 = urllib.request.urlopen(\
-          'http://geodesy.unr.edu/NGLStationPages/llh.out')
-       fileLines = response1.read().decode('utf-8').splitlines()
+    # Set reference site
+    settings.refsite = 'NONE'
+    if (results.ref != None):
+        settings.refsite = results.ref
 
-    else:
+    # Set epoch estimator
+    settings.estimator = 'wmean'
+    if (getattr(results,'estimator',None) != None):
+        settings.estimator = results.estimator
+
+    settings.vabs = (results.vabs == True)
+    settings.eon = (results.eon == True)
+    settings.output = results.output
+    return settings
+
+def readStationTable(analysisCenter, report=None):
+    '''Return the lines of the station position table of the analysis center'''
+    if analysisCenter not in ("JPL", "NGL"):
        raise Exception("analysisCenter supplied as "+analysisCenter+" but only JPL,NGL are supported")
-       
+    import urllib.request
+
+    with stage(report, "fetch_table") as record:
+       response1 = urllib.request.urlopen(dataSources[analysisCenter]["table"])
+       content = response1.read()
+       record.bytes_fetched += len(content)
+       fileLines = content.decode('utf-8').splitlines()
+       record.rows_parsed += len(fileLines)
+    return fileLines
+
+def centerSettings(settings, analysisCenter):
+    '''Copy of settings for another analysis center and its data sources'''
+    sources = dataSources[analysisCenter]
+    return objdict(settings, analysisCenter=analysisCenter,
+                   tableSource=sources["table"], seriesSource=sources["series"])
+
+def regionLocations(settings, fileLines):
+    '''
+    Return the LocationItems of the stations of the station table fileLines
+    inside the bounds of settings
+    '''
+    locations = []
+    for i in range(0,len(fileLines)):
+        location = LocationItem(fileLines[i],settings.analysisCenter)
+        
+        if location.stn != False:
+           lon = location.lon
+           lat = location.lat
+           if ((lon > settings.lonmin) & (lon < settings.lonmax) & (lat > settings.latmin) & (lat < settings.latmax)):
+              locations.append(location)
+    return locations
+
+def sourceLocations(settings, fileLines):
+    '''
+    Return {url: [lon, lat]} of the data a result for settings is computed
+    from: the series of the stations in the region, and the station table
+    and reference series with None, as they matter anywhere in the region
+    '''
+    locations = {settings.tableSource: None}
+    if (settings.refsite != 'NONE'):
+        locations[settings.seriesSource.format(settings.refsite)] = None
+    for location in regionLocations(settings, fileLines):
+        url = settings.seriesSource.format(location.stn)
+        if (url not in locations):
+            locations[url] = [location.lon, location.lat]
+    return locations
+
+def sourceStamps(urls, report=None, threads=None):
+    '''
+    Return {url: stamp} with the Content-Length and Last-Modified headers
+    of each URL, from HEAD requests made by up to threads (default
+    fetchThreads) at a time.  The stamp is None when the server does not
+    answer or sends neither header.
+    '''
+    import urllib.request
+    from concurrent.futures import ThreadPoolExecutor
+
+    def head(url):
+        try:
+            with urllib.request.urlopen(urllib.request.Request(url, method="HEAD")) as response:
+                length = response.headers.get("Content-Length")
+                modified = response.headers.get("Last-Modified")
+        except OSError:
+            return None
+        if ((length == None) & (modified == None)):
+            return None
+        return "{} {}".format(length, modified)
+
+    with stage(report, "check_sources") as record:
+        with ThreadPoolExecutor(max_workers=threads or fetchThreads) as pool:
+            stamps = dict(zip(urls, pool.map(head, urls)))
+        record.stations += len(urls)
+    return stamps
+
+def readRegionSeries(settings, fileLines, store=None, report=None, threads=None):
+    '''
+    Return the LocationItems of the stations of the station table fileLines
+    inside the bounds of settings, and their series.  The series are
+    fetched by up to threads (default fetchThreads) at a time, or one at a
+    time when report profiles or traces memory: cProfile and tracemalloc
+    only follow one thread.
+    '''
+    analysisCenter = settings.analysisCenter
+    if (threads == None):
+        threads = fetchThreads
+    if ((report != None) and ((report.profile_dir != None) | (report.trace_memory == True))):
+        threads = 1
+    locations = regionLocations(settings, fileLines)
+
+    if ((threads <= 1) | (len(locations) <= 1)):
+        with stage(report, "read_region") as record:
+            seriesList = [readSeries(location.stn, analysisCenter, store, report) for location in locations]
+            record.stations += len(locations)
+        return locations, seriesList
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    # stages are not thread safe: each fetch records into its own report,
+    # whose times are merged as thread time under the wall clock of read_region
+    def read(location):
+        own = None
+        if (report != None):
+            own = PipelineReport()
+        return readSeries(location.stn, analysisCenter, store, own), own
+
+    with stage(report, "read_region") as record:
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            fetched = list(pool.map(read, locations))
+        record.stations += len(locations)
+    seriesList = []
+    for series, own in fetched:
+        if (own != None):
+            own.close()
+            report.merge(own, threaded=True)
+        seriesList.append(series)
+    return locations, seriesList
+
+def computeDisplacement(settings, report=None, store=None, fileLines=None):
+    '''
+    Return rows of [site,lon,lat,dE,dN,dV,sE,sN,sV] (mm) for the stations
+    inside the bounds of settings.  fileLines may hold an already fetched
+    station table.
+    '''
+    import numpy as np
+    from epoch_estimators import estimate
+
+    analysisCenter = settings.analysisCenter
+    ytime1, ytime2 = settings.ytime1, settings.ytime2
+    dwin1, dwin2 = settings.dwin1, settings.dwin2
+    refsite = settings.refsite
+
+    # Read table of positions
+    if (fileLines == None):
+        fileLines = readStationTable(analysisCenter, report)
 
     # Read reference series
     rlon = 0
     rlat = 0
     rrad = 0
     stop = 0
-    refsite = 'NONE'
-    if (results.ref != None):
-        refsite = results.ref
-        # JPL data has no header row
-        if analysisCenter == "JPL":
-            path = 'https://sideshow.jpl.nasa.gov/pub/JPL_GPS_Timeseries/' + \
-                   'repro2018a/post/point/' + refsite + '.series'
-        # NGL data first line is the header
-        elif analysisCenter == "NGL":
-            path = 'http://geodesy.unr.edu/gps_timeseries/tenv3/IGS14/'\
-                  + refsite +'.tenv3'
-        request = urllib.request.Request(path)
-        response2 = urllib.request.urlopen(request)
-        series = response2.read().decode('utf-8').splitlines()
-        if analysisCenter == "NGL":
-            series = series[1:]
-    
+    if (refsite != 'NONE'):
+        series = readSeries(refsite, analysisCenter, store, report)
 
         # Compute reference values
-        rlon = 0
-        rlat = 0
-        rrad = 0
-        rlon1 = 0
-        rlat1 = 0
-        rrad1 = 0
-        slon1 = 0
-        slat1 = 0
-        srad1 = 0
-        rlon2 = 0
-        rlat2 = 0
-        rrad2 = 0
-        slon2 = 0
-        slat2 = 0
-        srad2 = 0
-        scount1 = 0
-        scount2 = 0
-        for j in range(0,len(series)):
-            item = SeriesItem(series[j],analysisCenter)
-            if (math.sqrt((float(item.fracYr)-ytime1)*(float(item.fracYr)-ytime1))) < dwin1:
-                sigs1 = float(item.eSig)*float(item.eSig)
-                sigs2 = float(item.nSig)*float(item.nSig)
-                sigs3 = float(item.uSig)*float(item.uSig)
-                rlon1 = rlon1 + float(item.ePos)/sigs1
-                rlat1 = rlat1 + float(item.nPos)/sigs2
-                rrad1 = rrad1 + float(item.uPos)/sigs3
-                slon1 = slon1 + 1/sigs1
-                slat1 = slat1 + 1/sigs2
-                srad1 = srad1 + 1/sigs3
-                scount1 = scount1 + 1
-            if (math.sqrt((float(item.fracYr)-ytime2)*(float(item.fracYr)-ytime2))) < dwin2:
-                sigs1 = float(item.eSig)*float(item.eSig)
-                sigs2 = float(item.nSig)*float(item.nSig)
-                sigs3 = float(item.uSig)*float(item.uSig)
-                rlon2 = rlon2 + float(item.ePos)/sigs1
-                rlat2 = rlat2 + float(item.nPos)/sigs2
-                rrad2 = rrad2 + float(item.uPos)/sigs3
-                slon2 = slon2 + 1/sigs1
-                slat2 = slat2 + 1/sigs2
-                srad2 = srad2 + 1/sigs3
-                scount2  = scount2  + 1
-        if ((scount1 >= 1) & (scount2 >= 1)):
-            rlon = 1000.*(rlon2/slon2-rlon1/slon1)
-            rlat = 1000.*(rlat2/slat2-rlat1/slat1)
-            rrad = 1000.*(rrad2/srad2-rrad1/srad1)
+        with stage(report, "window_mean"):
+            mean1,var1,count1 = estimate([series],ytime1,dwin1,settings.estimator)
+            mean2,var2,count2 = estimate([series],ytime2,dwin2,settings.estimator)
+        if ((count1[0] >= 1) & (count2[0] >= 1)):
+            rlon,rlat,rrad = [float(v) for v in 1000.*(mean2[0]-mean1[0])]
 
         # Only use displacements computed from both epochs
-        if ((scount1 < 1) | (scount2 < 1)):
+        if ((count1[0] < 1) | (count2[0] < 1)):
             stop = 1
             print("Reference site has missing data!")
 
+    # Read time series of the stations in the region
+    locations, seriesList = readRegionSeries(settings, fileLines, store, report)
+
+    # Compute displacements of all stations at once
+    with stage(report, "window_mean") as record:
+        mean1,var1,count1 = estimate(seriesList,ytime1,dwin1,settings.estimator)
+        mean2,var2,count2 = estimate(seriesList,ytime2,dwin2,settings.estimator)
+        record.stations += len(seriesList)
+    with np.errstate(invalid='ignore'):
+        offsets = 1000.*(mean2-mean1)
+        sigmas = 1000.*np.sqrt(var1+var2)
+
+    # Subtract reference values
+    offsets = offsets-[rlon,rlat,rrad]
+    if (settings.vabs == True):
+        offsets[:,2] = offsets[:,2]+rrad
+
+    data_table = []
+    for k in range(0,len(locations)):
+        # Only use displacements computed from both epochs
+        if ((count1[k] >= 1) & (count2[k] >= 1) & (stop != 1)):
+            vlon,vlat,vrad = [float(v) for v in offsets[k]]
+            slon,slat,srad = [float(v) for v in sigmas[k]]
+            data_table.append([locations[k].stn,locations[k].lon,locations[k].lat,vlon,vlat,vrad,slon,slat,srad])
+
+    return data_table
+
+def writeOutput(settings, data_table):
+    '''Write the horizontal and vertical kml files and the table file'''
+    analysisCenter = settings.analysisCenter
+    refsite = settings.refsite
+    scale = settings.scale
+    msize = settings.msize
+    eon = settings.eon
+
     # Start kml file
-    outFile1 = open(results.output+'_horizontal.kml','w')
+    outFile1 = open(settings.output+'_horizontal.kml','w')
     print("<?xml version=\"1.0\" encoding=\"UTF-8\"?>",file=outFile1)
     print("<kml xmlns=\"http://www.opengis.net/kml/2.2\" xmlns:gx=\"http://www.google.com/kml/ext/2.2\" xmlns:kml=\"http://www.opengis.net/kml/2.2\" xmlns:atom=\"http://www.w3.org/2005/Atom\">",file=outFile1)
     print(" <Folder>",file=outFile1)
 
     # Start kml file
-    outFile2 = open(results.output+'_vertical.kml','w')
+    outFile2 = open(settings.output+'_vertical.kml','w')
     print("<?xml version=\"1.0\" encoding=\"UTF-8\"?>",file=outFile2)
     print("<kml xmlns=\"http://www.opengis.net/kml/2.2\" xmlns:gx=\"http://www.google.com/kml/ext/2.2\" xmlns:kml=\"http://www.opengis.net/kml/2.2\" xmlns:atom=\"http://www.w3.org/2005/Atom\">",file=outFile2)
     print(" <Folder>",file=outFile2)
 
     # Start txt file
-    outFile3 = open(results.output+'_table.txt','w')
+    outFile3 = open(settings.output+'_table.txt','w')
     print("Site          Lon          Lat      Delta E      Delta N      Delta V      Sigma E      Sigma N      Sigma V",file=outFile3)
 
-    # return data table
-    data_table = []
     # Add markers and vectors
-    for i in range(0,len(fileLines)):
-        location = LocationItem(fileLines[i],analysisCenter)
-        
-        if location.stn != False:
-           lon = location.lon
-           lat = location.lat
-           if ((lon > lonmin) & (lon < lonmax) & (lat > latmin) & (lat < latmax)):
-
-              # Read time series
-              if analysisCenter == "JPL":
-                  #series = get_localdata(location.stn)
-                  path = 'https://sideshow.jpl.nasa.gov/pub/' +\
-                       'JPL_GPS_Timeseries/repro2018a/post/point/' \
-                       + location.stn + '.series'
-                
-              elif analysisCenter == "NGL":
-                    path = 'http://geodesy.unr.edu/gps_timeseries/tenv3/IGS14/'\
-                        + location.stn +'.tenv3'
-              
-              request = urllib.request.Request(path)
-              response2 = urllib.request.urlopen(request)
-              series = response2.read().decode('utf-8').splitlines()
-              series = series[1:]
-              if analysisCenter == "NGL":
-                 series = series[1:]
-              
-              # Compute displacment
-              vlon = 0
-              vlat = 0
-              vrad = 0
-              slon = 0
-              slat = 0
-              srad = 0
-              vlon1 = 0
-              vlat1 = 0
-              vrad1 = 0
-              slon1 = 0
-              slat1 = 0
-              srad1 = 0
-              vlon2 = 0
-              vlat2 = 0
-              vrad2 = 0
-              slon2 = 0
-              slat2 = 0
-              srad2 = 0
-              scount1 = 0
-              scount2 = 0
-              for j in range(0,len(series)):
-                 item = SeriesItem(series[j],analysisCenter)
-                 if (math.sqrt((float(item.fracYr)-ytime1)*(float(item.fracYr)-ytime1))) < dwin1:
-                    sigs1 = float(item.eSig)*float(item.eSig)
-                    sigs2 = float(item.nSig)*float(item.nSig)
-                    sigs3 = float(item.uSig)*float(item.uSig)
-                    vlon1 = vlon1 + float(item.ePos)/sigs1
-                    vlat1 = vlat1 + float(item.nPos)/sigs2
-                    vrad1 = vrad1 + float(item.uPos)/sigs3
-                    slon1 = slon1 + 1/sigs1
-                    slat1 = slat1 + 1/sigs2
-                    srad1 = srad1 + 1/sigs3
-                    scount1 = scount1 + 1
-                 if (math.sqrt((float(item.fracYr)-ytime2)*(float(item.fracYr)-ytime2))) < dwin2:
-                    sigs1 = float(item.eSig)*float(item.eSig)
-                    sigs2 = float(item.nSig)*float(item.nSig)
-                    sigs3 = float(item.uSig)*float(item.uSig)
-                    vlon2 = vlon2 + float(item.ePos)/sigs1
-                    vlat2 = vlat2 + float(item.nPos)/sigs2
-                    vrad2 = vrad2 + float(item.uPos)/sigs3
-                    slon2 = slon2 + 1/sigs1
-                    slat2 = slat2 + 1/sigs2
-                    srad2 = srad2 + 1/sigs3
-                    scount2  = scount2  + 1
-              
-              if ((scount1 >= 1) & (scount2 >= 1)):
-                 vlon = 1000.*(vlon2/slon2-vlon1/slon1)
-                 vlat = 1000.*(vlat2/slat2-vlat1/slat1)
-                 vrad = 1000.*(vrad2/srad2-vrad1/srad1)
-                 slon = 1000.*math.sqrt(1/slon1+1/slon2)
-                 slat = 1000.*math.sqrt(1/slat1+1/slat2)
-                 srad = 1000.*math.sqrt(1/srad1+1/srad2)
-
-              # Subtract reference values
-              vlon = vlon-rlon
-              vlat = vlat-rlat
-              vrad = vrad-rrad
-              if (results.vabs == True):
-                 vrad = vrad+rrad
-
-              # Only use displacements computed from both epochs
-              if ((scount1 >= 1) & (scount2 >= 1) & (stop != 1)):
-
-                 # Set marker color
-                 if (location.stn == refsite):
-                    mcolor = 'FF0000FF'
-                 else:
-                    mcolor = 'FF78FF78'
-
-                 # Draw marker 
-                 if analysisCenter == "JPL":
-                    linkPlot = \
-'"https://sideshow.jpl.nasa.gov/post/links/{:s}.html\">'.format(location.stn)
-                    imgPlot = \
-'"https://sideshow.jpl.nasa.gov/post/plots/{:s}.jpg\"'.format(location.stn)
-                 if analysisCenter == "NGL":
-                    linkPlot = \
-'"http://geodesy.unr.edu/NGLStationPages/stations/{:s}.sta\"'.format(location.stn)
-                    imgPlot = \
-'"http://geodesy.unr.edu/tsplots/IGS14/IGS14/TimeSeries/{:s}.png"'.format(location.stn)
-
-                 print("  <Placemark>",file=outFile1)
-                 print("   <description><![CDATA[",file=outFile1)
-                 #print("    <a href=\"https://sideshow.jpl.nasa.gov/post/links/{:s}.html\">".format(location.stn),file=outFile1)
-                 #print("     <img src=\"https://sideshow.jpl.nasa.gov/post/plots/{:s}.jpg\" width=\"300\" height=\"300\">".format(location.stn),file=outFile1)
-                 print("    <a href=" + linkPlot, file=outFile1)
-                 print("     <img src=" + imgPlot + " width=\"300\" height=\"300\">",file=outFile1)
-                 print("    </a>",file=outFile1)
-                 print("   ]]></description>",file=outFile1)
-                 print("   <Style><IconStyle>",file=outFile1)
-                 print("    <color>{:s}</color>".format(mcolor),file=outFile1)
-                 print("    <scale>{:f}</scale>".format(msize),file=outFile1)
-                 print("    <Icon><href>https://maps.google.com/mapfiles/kml/paddle/wht-blank.png</href></Icon>",file=outFile1)
-                 print("   </IconStyle></Style>",file=outFile1)
-                 print("   <Point>",file=outFile1)
-                 print("    <coordinates>",file=outFile1)
-                 print("     {:f},{:f},0".format(lon,lat),file=outFile1)
-                 print("    </coordinates>",file=outFile1)
-                 print("   </Point>",file=outFile1)
-                 print("  </Placemark>",file=outFile1)
-
-                 # Draw marker 
-                 print("  <Placemark>",file=outFile2)
-                 print("   <description><![CDATA[",file=outFile2)
-                 #print("    <a href=\"https://sideshow.jpl.nasa.gov/post/links/{:s}.html\">".format(location.stn),file=outFile2)
-                 #print("     <img src=\"https://sideshow.jpl.nasa.gov/post/plots/{:s}.jpg\" width=\"300\" height=\"300\">".format(location.stn),file=outFile2)
-                 print("    <a href=" + linkPlot, file=outFile2)
-                 print("     <img src=" + imgPlot + " width=\"300\" height=\"300\">",file=outFile2)
-                 print("    </a>",file=outFile2)
-                 print("   ]]></description>",file=outFile2)
-                 print("   <Style><IconStyle>",file=outFile2)
-                 print("    <color>{:s}</color>".format(mcolor),file=outFile2)
-                 print("    <scale>{:f}</scale>".format(msize),file=outFile2)
-                 print("    <Icon><href>https://maps.google.com/mapfiles/kml/paddle/wht-blank.png</href></Icon>",file=outFile2)
-                 print("   </IconStyle></Style>",file=outFile2)
-                 print("   <Point>",file=outFile2)
-                 print("    <coordinates>",file=outFile2)
-                 print("     {:f},{:f},0".format(lon,lat),file=outFile2)
-                 print("    </coordinates>",file=outFile2)
-                 print("   </Point>",file=outFile2)
-                 print("  </Placemark>",file=outFile2)
-
-                 # Draw vector    
-                 print("  <Placemark>",file=outFile1)
-                 print("   <Style><LineStyle>",file=outFile1)
-                 print("    <color>FFB478FF</color>",file=outFile1)
-                 print("    <width>2</width>",file=outFile1)
-                 print("   </LineStyle></Style>",file=outFile1)
-                 print("   <LineString>",file=outFile1)
-                 print("   <coordinates>",file=outFile1)
-                 print("   {:f},{:f},0".format(lon,lat),file=outFile1)
-                 print("   {:f},{:f},0".format(lon+vlon/scale/math.cos(lat*math.pi/180.),lat+vlat/scale),file=outFile1)
-                 print("    </coordinates>",file=outFile1)
-                 print("   </LineString>",file=outFile1)
-                 print("  </Placemark>",file=outFile1)
-
-                 # Draw sigmas
-                 if (results.eon == True):
-                    print("  <Placemark>",file=outFile1)
-                    print("   <Style>",file=outFile1)
-                    print("    <LineStyle>",file=outFile1)
-                    print("     <color>FF000000</color>",file=outFile1)
-                    print("     <width>2</width>",file=outFile1)
-                    print("    </LineStyle>",file=outFile1)
-                    print("    <PolyStyle>",file=outFile1)
-                    print("     <color>FF000000</color>",file=outFile1)
-                    print("     <fill>0</fill>",file=outFile1)
-                    print("    </PolyStyle>",file=outFile1)
-                    print("   </Style>",file=outFile1)
-                    print("   <Polygon>",file=outFile1)
-                    print("    <outerBoundaryIs>",file=outFile1)
-                    print("     <LinearRing>",file=outFile1)
-                    print("      <coordinates>",file=outFile1)
-
-                    theta = 0
-                    for k in range(0,31):
-                        angle = k/30*2*math.pi
-                        elon = slon*math.cos(angle)*math.cos(theta)-slat*math.sin(angle)*math.sin(theta)
-                        elat = slon*math.cos(angle)*math.sin(theta)+slat*math.sin(angle)*math.cos(theta)
-                        elon = (elon+vlon)/scale/math.cos(lat*math.pi/180.)
-                        elat = (elat+vlat)/scale
-                        print("      {:f},{:f},0".format(lon+elon,lat+elat),file=outFile1)
-
-                    print("      </coordinates>",file=outFile1)
-                    print("     </LinearRing>",file=outFile1)
-                    print("    </outerBoundaryIs>",file=outFile1)
-                    print("   </Polygon>",file=outFile1)
-                    print("  </Placemark>",file=outFile1)
-
-                 # Set circle color
-                 if (vrad > 0):
-                    lcolor = 'FF0000FF'
-                    pcolor = '7F0000FF'
-                 else:
-                    lcolor = 'FFFF0000'
-                    pcolor = '7FFF0000'
-
-                 # Draw circle size proportional to vertical
-                 print("  <Placemark>",file=outFile2)
-                 print("   <Style>",file=outFile2)
-                 print("    <LineStyle>",file=outFile2)
-                 print("     <color>{:s}</color>".format(lcolor),file=outFile2)
-                 print("     <width>1</width>",file=outFile2)
-                 print("    </LineStyle>",file=outFile2)
-                 print("    <PolyStyle>",file=outFile2)
-                 print("     <color>{:s}</color>".format(pcolor),file=outFile2)
-                 print("     <fill>1</fill>",file=outFile2)
-                 print("    </PolyStyle>",file=outFile2)
-                 print("   </Style>",file=outFile2)
-                 print("   <Polygon>",file=outFile2)
-                 print("    <outerBoundaryIs>",file=outFile2)
-                 print("     <LinearRing>",file=outFile2)
-                 print("      <coordinates>",file=outFile2)
-
-                 theta = 0
-                 for k in range(0,31):
-                     angle = k/30*2*math.pi
-                     elon = vrad*math.cos(angle)*math.cos(theta)-vrad*math.sin(angle)*math.sin(theta)
-                     elat = vrad*math.cos(angle)*math.sin(theta)+vrad*math.sin(angle)*math.cos(theta)
-                     elon = (elon+0)/scale/math.cos(lat*math.pi/180.)
-                     elat = (elat+0)/scale
-                     print("      {:f},{:f},0".format(lon+elon,lat+elat),file=outFile2)
-
-                 print("      </coordinates>",file=outFile2)
-                 print("     </LinearRing>",file=outFile2)
-                 print("    </outerBoundaryIs>",file=outFile2)
-                 print("   </Polygon>",file=outFile2)
-                 print("  </Placemark>",file=outFile2)
-
-                 # Make table
-                 print("{:s} {:12f} {:12f} {:12f} {:12f} {:12f} {:12f} {:12f} {:12f}".format(
-                 location.stn,lon,lat,vlon,vlat,vrad,slon,slat,srad),file=outFile3)
-
-                 data_table.append([location.stn,lon,lat,vlon,vlat,vrad,slon,slat,srad])
+    for stn,lon,lat,vlon,vlat,vrad,slon,slat,srad in data_table:
+
+        # Set marker color
+        if (stn == refsite):
+           mcolor = 'FF0000FF'
+        else:
+           mcolor = 'FF78FF78'
+
+        # Draw marker 
+        if analysisCenter == "JPL":
+           linkPlot = \
+'"https://sideshow.jpl.nasa.gov/post/links/{:s}.html\">'.format(stn)
+           imgPlot = \
+'"https://sideshow.jpl.nasa.gov/post/plots/{:s}.jpg\"'.format(stn)
+        if analysisCenter == "NGL":
+           linkPlot = \
+'"http://geodesy.unr.edu/NGLStationPages/stations/{:s}.sta\"'.format(stn)
+           imgPlot = \
+'"http://geodesy.unr.edu/tsplots/IGS14/IGS14/TimeSeries/{:s}.png"'.format(stn)
+
+        print("  <Placemark>",file=outFile1)
+        print("   <description><![CDATA[",file=outFile1)
+        #print("    <a href=\"https://sideshow.jpl.nasa.gov/post/links/{:s}.html\">".format(stn),file=outFile1)
+        #print("     <img src=\"https://sideshow.jpl.nasa.gov/post/plots/{:s}.jpg\" width=\"300\" height=\"300\">".format(stn),file=outFile1)
+        print("    <a href=" + linkPlot, file=outFile1)
+        print("     <img src=" + imgPlot + " width=\"300\" height=\"300\">",file=outFile1)
+        print("    </a>",file=outFile1)
+        print("   ]]></description>",file=outFile1)
+        print("   <Style><IconStyle>",file=outFile1)
+        print("    <color>{:s}</color>".format(mcolor),file=outFile1)
+        print("    <scale>{:f}</scale>".format(msize),file=outFile1)
+        print("    <Icon><href>https://maps.google.com/mapfiles/kml/paddle/wht-blank.png</href></Icon>",file=outFile1)
+        print("   </IconStyle></Style>",file=outFile1)
+        print("   <Point>",file=outFile1)
+        print("    <coordinates>",file=outFile1)
+        print("     {:f},{:f},0".format(lon,lat),file=outFile1)
+        print("    </coordinates>",file=outFile1)
+        print("   </Point>",file=outFile1)
+        print("  </Placemark>",file=outFile1)
+
+        # Draw marker 
+        print("  <Placemark>",file=outFile2)
+        print("   <description><![CDATA[",file=outFile2)
+        #print("    <a href=\"https://sideshow.jpl.nasa.gov/post/links/{:s}.html\">".format(stn),file=outFile2)
+        #print("     <img src=\"https://sideshow.jpl.nasa.gov/post/plots/{:s}.jpg\" width=\"300\" height=\"300\">".format(stn),file=outFile2)
+        print("    <a href=" + linkPlot, file=outFile2)
+        print("     <img src=" + imgPlot + " width=\"300\" height=\"300\">",file=outFile2)
+        print("    </a>",file=outFile2)
+        print("   ]]></description>",file=outFile2)
+        print("   <Style><IconStyle>",file=outFile2)
+        print("    <color>{:s}</color>".format(mcolor),file=outFile2)
+        print("    <scale>{:f}</scale>".format(msize),file=outFile2)
+        print("    <Icon><href>https://maps.google.com/mapfiles/kml/paddle/wht-blank.png</href></Icon>",file=outFile2)
+        print("   </IconStyle></Style>",file=outFile2)
+        print("   <Point>",file=outFile2)
+        print("    <coordinates>",file=outFile2)
+        print("     {:f},{:f},0".format(lon,lat),file=outFile2)
+        print("    </coordinates>",file=outFile2)
+        print("   </Point>",file=outFile2)
+        print("  </Placemark>",file=outFile2)
+
+        # Draw vector    
+        print("  <Placemark>",file=outFile1)
+        print("   <Style><LineStyle>",file=outFile1)
+        print("    <color>FFB478FF</color>",file=outFile1)
+        print("    <width>2</width>",file=outFile1)
+        print("   </LineStyle></Style>",file=outFile1)
+        print("   <LineString>",file=outFile1)
+        print("   <coordinates>",file=outFile1)
+        print("   {:f},{:f},0".format(lon,lat),file=outFile1)
+        print("   {:f},{:f},0".format(lon+vlon/scale/math.cos(lat*math.pi/180.),lat+vlat/scale),file=outFile1)
+        print("    </coordinates>",file=outFile1)
+        print("   </LineString>",file=outFile1)
+        print("  </Placemark>",file=outFile1)
+
+        # Draw sigmas
+        if (eon == True):
+           print("  <Placemark>",file=outFile1)
+           print("   <Style>",file=outFile1)
+           print("    <LineStyle>",file=outFile1)
+           print("     <color>FF000000</color>",file=outFile1)
+           print("     <width>2</width>",file=outFile1)
+           print("    </LineStyle>",file=outFile1)
+           print("    <PolyStyle>",file=outFile1)
+           print("     <color>FF000000</color>",file=outFile1)
+           print("     <fill>0</fill>",file=outFile1)
+           print("    </PolyStyle>",file=outFile1)
+           print("   </Style>",file=outFile1)
+           print("   <Polygon>",file=outFile1)
+           print("    <outerBoundaryIs>",file=outFile1)
+           print("     <LinearRing>",file=outFile1)
+           print("      <coordinates>",file=outFile1)
+
+           theta = 0
+           for k in range(0,31):
+               angle = k/30*2*math.pi
+               elon = slon*math.cos(angle)*math.cos(theta)-slat*math.sin(angle)*math.sin(theta)
+               elat = slon*math.cos(angle)*math.sin(theta)+slat*math.sin(angle)*math.cos(theta)
+               elon = (elon+vlon)/scale/math.cos(lat*math.pi/180.)
+               elat = (elat+vlat)/scale
+               print("      {:f},{:f},0".format(lon+elon,lat+elat),file=outFile1)
+
+           print("      </coordinates>",file=outFile1)
+           print("     </LinearRing>",file=outFile1)
+           print("    </outerBoundaryIs>",file=outFile1)
+           print("   </Polygon>",file=outFile1)
+           print("  </Placemark>",file=outFile1)
+
+        # Set circle color
+        if (vrad > 0):
+           lcolor = 'FF0000FF'
+           pcolor = '7F0000FF'
+        else:
+           lcolor = 'FFFF0000'
+           pcolor = '7FFF0000'
+
+        # Draw circle size proportional to vertical
+        print("  <Placemark>",file=outFile2)
+        print("   <Style>",file=outFile2)
+        print("    <LineStyle>",file=outFile2)
+        print("     <color>{:s}</color>".format(lcolor),file=outFile2)
+        print("     <width>1</width>",file=outFile2)
+        print("    </LineStyle>",file=outFile2)
+        print("    <PolyStyle>",file=outFile2)
+        print("     <color>{:s}</color>".format(pcolor),file=outFile2)
+        print("     <fill>1</fill>",file=outFile2)
+        print("    </PolyStyle>",file=outFile2)
+        print("   </Style>",file=outFile2)
+        print("   <Polygon>",file=outFile2)
+        print("    <outerBoundaryIs>",file=outFile2)
+        print("     <LinearRing>",file=outFile2)
+        print("      <coordinates>",file=outFile2)
+
+        theta = 0
+        for k in range(0,31):
+            angle = k/30*2*math.pi
+            elon = vrad*math.cos(angle)*math.cos(theta)-vrad*math.sin(angle)*math.sin(theta)
+            elat = vrad*math.cos(angle)*math.sin(theta)+vrad*math.sin(angle)*math.cos(theta)
+            elon = (elon+0)/scale/math.cos(lat*math.pi/180.)
+            elat = (elat+0)/scale
+            print("      {:f},{:f},0".format(lon+elon,lat+elat),file=outFile2)
+
+        print("      </coordinates>",file=outFile2)
+        print("     </LinearRing>",file=outFile2)
+        print("    </outerBoundaryIs>",file=outFile2)
+        print("   </Polygon>",file=outFile2)
+        print("  </Placemark>",file=outFile2)
+
+        # Make table
+        print("{:s} {:12f} {:12f} {:12f} {:12f} {:12f} {:12f} {:12f} {:12f}".format(
+        stn,lon,lat,vlon,vlat,vrad,slon,slat,srad),file=outFile3)
 
     # Finish files
     print(" </Folder>",file=outFile1)
@@ -559,7 +678,6 @@ def getDisplacement(results):
     print("</kml>",file=outFile2)
     outFile2.close()
     outFile3.close()
-    return data_table
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Cache of getDisplacement result tables.
+
+Results are keyed on the normalized parameters that change the numbers
+(analysis center and its data sources, epochs, averaging windows,
+reference site, absolute verticals, epoch estimator); the region is stored
+with each entry.  A request whose box lies
+inside a cached box is answered by filtering the cached rows, so one
+precomputed run over a wide area serves every smaller query inside it.
+Displacements do not depend on the region, only on which stations fall in
+it, so the filtered rows are exactly what a fresh run would return.
+
+Each entry also keeps stamps (size and Last-Modified) of the station table
+and series it was computed from, and is used only while HEAD requests
+return the same stamps for the table, the reference series and the series
+of the stations inside the requested box; an appended or reprocessed series invalidates it.
+Entries without stamps, or whose sources do not answer, expire after
+max_age seconds instead.  The cache can be filled lazily through
+getDisplacement(..., cache=ResultCache(dir)) or ahead of time for the
+popular boxes:
+
+    result_cache.py --cache cachedir --store seriesdir --spans 30 365
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import tempfile
+import argparse
+import datetime
+
+from file_lock import locked
+
+KEY_FIELDS = ("analysisCenter", "tableSource", "seriesSource", "ytime1", "ytime2", "dwin1",
+              "dwin2", "refsite", "vabs", "estimator")
+
+# Boxes GeoGateway users ask for over and over
+POPULAR_REGIONS = {
+    "saltonsea": {"lat": 33.2, "lon": -115.7, "width": 1.6, "height": 1.4},
+    "ridgecrest": {"lat": 35.7, "lon": -117.6, "width": 1.6, "height": 1.4},
+    "labasin": {"lat": 34.0, "lon": -118.2, "width": 1.6, "height": 1.0},
+}
+
+# Allowance when comparing box edges computed from center +- size/2
+_EPS = 1e-9
+
+
+def _bounds(settings):
+    return [settings.latmin, settings.latmax, settings.lonmin, settings.lonmax]
+
+
+def _contains(outer, inner):
+    return (outer[0] <= inner[0] + _EPS and outer[1] >= inner[1] - _EPS
+            and outer[2] <= inner[2] + _EPS and outer[3] >= inner[3] - _EPS)
+
+
+def _inside(rows, bounds):
+    """Rows strictly inside bounds, with the same test getDisplacement uses."""
+    latmin, latmax, lonmin, lonmax = bounds
+    return [row for row in rows
+            if lonmin < row[1] < lonmax and latmin < row[2] < latmax]
+
+
+def _needed(entry, bounds):
+    """URLs of the stamps of entry that can change its rows inside bounds:
+    those without a location (station table, reference series) and the
+    series of the stations inside bounds."""
+    latmin, latmax, lonmin, lonmax = bounds
+    locations = entry.get("locations") or {}
+    urls = []
+    for url in entry.get("stamps") or {}:
+        where = locations.get(url)
+        if where is None or (lonmin < where[0] < lonmax and latmin < where[1] < latmax):
+            urls.append(url)
+    return urls
+
+
+class ResultCache:
+    """
+    Parameters
+    ----------
+    root :
+        Directory holding one json file per parameter key.
+    max_age :
+        Seconds an entry without stamps stays valid; default one day.
+    """
+
+    def __init__(self, root, max_age=86400.):
+        self.root = root
+        self.max_age = max_age
+        os.makedirs(root, exist_ok=True)
+
+    def key(self, settings):
+        """Normalized parameters and the file name derived from them."""
+        params = {}
+        for field in KEY_FIELDS:
+            value = settings[field]
+            params[field] = round(value, 9) if isinstance(value, float) else value
+        digest = hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest()
+        return params, os.path.join(self.root, digest + ".json")
+
+    def _read(self, filename):
+        try:
+            with open(filename) as inFile:
+                return json.load(inFile)
+        except (OSError, ValueError):
+            return None
+
+    def _valid(self, entry, current, now, urls=None):
+        """Whether entry still holds for the stamps in current of urls (by
+        default all its own); unknown stamps (None or missing) fall back to
+        the age of the entry."""
+        stamps = entry.get("stamps")
+        if stamps:
+            urls = list(stamps) if urls is None else urls
+            if all(current.get(url) is not None for url in urls):
+                return all(current[url] == stamps[url] for url in urls)
+        return now - entry["created"] < self.max_age
+
+    def lookup(self, settings, stamps=None):
+        """Return the rows for settings from a cached entry covering its
+        region, or None.  stamps is a function returning the current
+        {url: stamp} of a list of URLs (getDisplacementNGL.sourceStamps);
+        without it every entry is judged by its age."""
+        params, filename = self.key(settings)
+        cached = self._read(filename)
+        if cached is None or cached["params"] != params:
+            return None
+        bounds = _bounds(settings)
+        covering = [entry for entry in cached["entries"] if _contains(entry["bounds"], bounds)]
+        needed = [_needed(entry, bounds) for entry in covering]
+        urls = sorted({url for some in needed for url in some})
+        current = stamps(urls) if stamps is not None and urls else {}
+        now = time.time()
+        for entry, some in zip(covering, needed):
+            if self._valid(entry, current, now, some):
+                return _inside(entry["rows"], bounds)
+        return None
+
+    def insert(self, settings, data_table, stamps=None, locations=None):
+        """Store the rows computed for settings with the {url: stamp} of
+        the data they were computed from, replacing outdated entries and
+        entries whose region the new one covers.  locations gives the
+        [lon, lat] of the station of each series URL (None for the station
+        table and reference series), so lookups of a smaller box check the
+        series inside it only.  The key file is locked so concurrent
+        inserts do not drop each other's entries."""
+        params, filename = self.key(settings)
+        if stamps and None in stamps.values():
+            stamps = None
+        if stamps and locations:
+            locations = {url: list(where) for url, where in locations.items()
+                         if url in stamps and where is not None}
+        else:
+            locations = None
+        with locked(filename):
+            self._insert(settings, data_table, stamps, locations, params, filename)
+
+    def _insert(self, settings, data_table, stamps, locations, params, filename):
+        cached = self._read(filename)
+        if cached is None or cached["params"] != params:
+            cached = {"params": params, "entries": []}
+        bounds = _bounds(settings)
+        now = time.time()
+        # an entry is outdated when the new stamps differ from its own;
+        # URLs the new entry was not computed from count as unchanged
+        entries = [entry for entry in cached["entries"]
+                   if self._valid(entry, {**(entry.get("stamps") or {}), **(stamps or {})}, now)
+                   and not _contains(bounds, entry["bounds"])]
+        entries.append({"bounds": bounds, "created": now, "stamps": stamps,
+                        "locations": locations, "rows": [list(row) for row in data_table]})
+        cached["entries"] = entries
+
+        handle, tmpname = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+        with os.fdopen(handle, "w") as outFile:
+            json.dump(cached, outFile)
+        os.replace(tmpname, filename)
+
+    def clear(self):
+        for name in os.listdir(self.root):
+            if name.endswith((".json", ".lock")):
+                os.remove(os.path.join(self.root, name))
+
+
+def precompute(cache, regions, epochPairs, centers=("JPL",), ref=None,
+               dwin1=None, dwin2=None, vabs=False, estimator=None, store=None, report=None):
+    """
+    Compute and cache the displacement tables for every combination of
+    region (dicts with lat, lon, width, height), epoch pair and analysis
+    center.  The station table of each center is fetched once.
+    """
+    from getDisplacementNGL import (computeDisplacement, getSettings, objdict, readStationTable,
+                                    sourceLocations, sourceStamps)
+
+    count = 0
+    for center in centers:
+        fileLines = readStationTable(center, report)
+        for region in regions:
+            for epoch1, epoch2 in epochPairs:
+                settings = getSettings(objdict(
+                    lat=region["lat"], lon=region["lon"], width=region["width"],
+                    height=region["height"], epoch1=epoch1, epoch2=epoch2,
+                    analysisCenter=center, ref=ref, dwin1=dwin1, dwin2=dwin2,
+                    vabs=vabs, estimator=estimator, scale=None, mon=False, eon=False, output=None))
+                locations = sourceLocations(settings, fileLines)
+                stamps = sourceStamps(list(locations), report)
+                cache.insert(settings, computeDisplacement(settings, report, store, fileLines),
+                             stamps, locations)
+                count += 1
+    return count
+
+
+def _getParser():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--cache', action='store', dest='cache', required=True, help='result cache directory')
+    parser.add_argument('--store', action='store', dest='store', required=False, help='series store directory')
+    parser.add_argument('--regions', nargs='+', dest='regions', default=sorted(POPULAR_REGIONS),
+                        help='named regions: ' + ', '.join(sorted(POPULAR_REGIONS)))
+    parser.add_argument('--end', action='store', dest='end', required=False,
+                        help='second epoch as YYYY-MM-DD; default two weeks ago, when both centers have data')
+    parser.add_argument('--spans', nargs='+', type=int, dest='spans', default=[30, 365, 1826],
+                        help='days between first and second epoch')
+    parser.add_argument('-c', nargs='+', dest='centers', default=['JPL', 'NGL'], help='analysis centers')
+    parser.add_argument('--ref', action='store', dest='ref', required=False, help='reference site')
+    return parser
+
+
+def main():
+    results = _getParser().parse_args()
+    from series_store import SeriesStore
+
+    end = results.end
+    if end is None:
+        end = (datetime.date.today() - datetime.timedelta(days=14)).isoformat()
+    last = datetime.datetime.strptime(end, "%Y-%m-%d").date()
+    epochPairs = [((last - datetime.timedelta(days=span)).isoformat(), end)
+                  for span in results.spans]
+    unknown = [name for name in results.regions if name not in POPULAR_REGIONS]
+    if unknown:
+        sys.exit("unknown regions: " + ", ".join(unknown))
+    regions = [POPULAR_REGIONS[name] for name in results.regions]
+    store = SeriesStore(results.store) if results.store else None
+    count = precompute(ResultCache(results.cache), regions, epochPairs,
+                       centers=results.centers, ref=results.ref, store=store)
+    print("cached {:d} results".format(count))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,282 @@
+# -*- coding: utf-8 -*-
+"""
+Local store of GNSS position series with incremental refresh.
+
+Series are parsed into columns (fractional year, E/N/U position and sigma in
+m) held as numpy arrays.  SeriesStore keeps the raw file and the parsed
+columns of every station it has seen under its root directory; on later runs
+it asks the server only for the bytes past the cached end with an HTTP Range
+request (plus a short overlap that must match the cached copy) and parses
+just the appended epochs.  Servers that ignore Range get a full download,
+but still only the lines after the cached part are parsed.  If the cached
+part of the file changed (a reprocessed series) the station is parsed again
+from scratch.  A Range refresh only sees changes within its overlap, so
+every verify_age (a week by default) the whole file is downloaded and
+compared instead; an edit of older epochs can go unnoticed until then.
+"""
+
+import os
+import time
+import tempfile
+import urllib.error
+import urllib.request
+
+import numpy as np
+
+from stage_timer import stage
+from file_lock import locked
+
+# Bytes of the cached copy requested again on refresh to check that the
+# remote file was only appended to.
+OVERLAP = 512
+
+FIELDS = ("fracYr", "ePos", "nPos", "uPos", "eSig", "nSig", "uSig")
+
+# Columns (from 0) holding FIELDS in each center's series format.
+# JPL .series:
+#   1994.00136893 0.877450 -0.309555 0.011551 0.000609 0.000682 0.002465 ...
+# NGL .tenv3, one header line:
+#   site YYMMMDD yyyy.yyyy __MJD week d reflon _e0(m) __east(m) ____n0(m)
+#   _north(m) u0(m) ____up(m) _ant(m) sig_e(m) sig_n(m) sig_u(m) ...
+COLUMNS = {
+    "JPL": (0, 1, 2, 3, 4, 5, 6),
+    "NGL": (2, 8, 10, 12, 14, 15, 16),
+}
+
+
+def _parse_line(line, columns):
+    item = line.split()
+    try:
+        return [float(item[c]) for c in columns]
+    except (ValueError, IndexError):
+        return None
+
+
+def parse_series(lines, center):
+    """
+    Parse series lines of the given analysis center into a dict of float
+    arrays keyed by FIELDS.  Header or malformed lines are skipped.
+    """
+    columns = COLUMNS[center]
+    start = 0
+    while start < len(lines) and _parse_line(lines[start], columns) is None:
+        start += 1
+    if start < len(lines):
+        # well formed series after their header go through np.loadtxt,
+        # several times faster than splitting the lines in Python
+        try:
+            table = np.loadtxt(lines[start:], usecols=columns, ndmin=2)
+            return {name: table[:, i].copy() for i, name in enumerate(FIELDS)}
+        except (ValueError, IndexError):
+            pass
+    rows = [_parse_line(line, columns) for line in lines[start:]]
+    table = np.array([row for row in rows if row is not None], dtype=float).reshape(-1, len(FIELDS))
+    return {name: table[:, i].copy() for i, name in enumerate(FIELDS)}
+
+
+def append_series(series, new):
+    """Return series followed by new; the epochs of series from the first
+    epoch of new on are replaced, as the last line of the previous refresh
+    may have been incomplete and is parsed again."""
+    if len(new["fracYr"]):
+        keep = series["fracYr"] < new["fracYr"][0]
+        series = {name: values[keep] for name, values in series.items()}
+    return {name: np.concatenate([series[name], new[name]]) for name in FIELDS}
+
+
+def fetch_series(url, center, report=None):
+    """Download and parse a whole series without any local store."""
+    with stage(report, "fetch_series") as record:
+        content = urllib.request.urlopen(url).read()
+        record.bytes_fetched += len(content)
+        record.stations += 1
+    with stage(report, "parse_series") as record:
+        series = parse_series(content.decode("utf-8").splitlines(), center)
+        record.rows_parsed += len(series["fracYr"])
+    return series
+
+
+def _complete_lines(content):
+    """Content up to its last newline.  Only this much is kept as the raw
+    copy, so an unterminated last line (parsed all the same) is fetched
+    again with the next refresh."""
+    end = content.rfind(b"\n") + 1
+    return content[:end]
+
+
+def _write_atomic(filename, write):
+    handle, tmpname = tempfile.mkstemp(dir=os.path.dirname(filename),
+                                       suffix=".tmp")
+    try:
+        with os.fdopen(handle, "wb") as outFile:
+            write(outFile)
+        os.replace(tmpname, filename)
+    except BaseException:
+        os.unlink(tmpname)
+        raise
+
+
+class SeriesStore:
+    """
+    Parameters
+    ----------
+    root :
+        Directory for the store; one subdirectory per analysis center.
+    max_age :
+        Seconds after a refresh during which a station is served from disk
+        without contacting the server at all.
+    verify_age :
+        Seconds after which a refresh downloads the whole file and compares
+        it with the cached copy.  In between, Range refreshes only notice
+        changes within the last OVERLAP bytes, so an upstream edit of older
+        epochs is picked up at the next full comparison.  0 compares the
+        whole file on every refresh.
+    """
+
+    def __init__(self, root, max_age=0, verify_age=7 * 86400.):
+        self.root = root
+        self.max_age = max_age
+        self.verify_age = verify_age
+
+    def _paths(self, center, stn):
+        folder = os.path.join(self.root, center)
+        os.makedirs(folder, exist_ok=True)
+        return os.path.join(folder, stn + ".raw"), os.path.join(folder, stn + ".npz")
+
+    def _load(self, center, stn):
+        """Return (series, meta) from disk, or None when the station is
+        missing or its raw file and columns do not agree."""
+        rawname, npzname = self._paths(center, stn)
+        try:
+            with np.load(npzname) as cached:
+                series = {name: cached[name] for name in FIELDS}
+                meta = {"size": int(cached["size"]), "checked": float(cached["checked"]),
+                        "verified": float(cached["verified"]) if "verified" in cached.files else 0.}
+            if os.path.getsize(rawname) != meta["size"]:
+                return None
+        except (OSError, KeyError, ValueError):
+            return None
+        return series, meta
+
+    def _raw(self, center, stn, start=0):
+        with open(self._paths(center, stn)[0], "rb") as inFile:
+            inFile.seek(start)
+            return inFile.read()
+
+    def _save(self, center, stn, size, series, verified, raw=None, tail=None):
+        """
+        Write the parsed columns and, when given, the whole raw file or the
+        bytes appended to it.  The columns record the raw size they belong
+        to, so a store left half written is simply fetched again.
+        """
+        rawname, npzname = self._paths(center, stn)
+        if raw is not None:
+            _write_atomic(rawname, lambda outFile: outFile.write(raw))
+        if tail:
+            with open(rawname, "ab") as outFile:
+                outFile.write(tail)
+        _write_atomic(
+            npzname,
+            lambda outFile: np.savez(outFile, size=size, checked=time.time(),
+                                     verified=verified, **series),
+        )
+
+    def cached(self, center, stn):
+        """Return the stored series of a station without refreshing it, or
+        None when the station has not been fetched yet."""
+        entry = self._load(center, stn)
+        return None if entry is None else entry[0]
+
+    def get(self, center, stn, url, report=None):
+        """
+        Return the series of a station, refreshed from url.  Only bytes and
+        epochs appended since the last refresh are fetched and parsed when
+        the server allows it.  The station is locked for the refresh, so
+        processes sharing the store never append the same bytes twice.
+        """
+        with locked(self._paths(center, stn)[0]):
+            return self._get(center, stn, url, report)
+
+    def _get(self, center, stn, url, report):
+        entry = self._load(center, stn)
+        if entry is None:
+            return self._full(center, stn, url, report)
+        series, meta = entry
+        size = meta["size"]
+        now = time.time()
+        if now - meta["checked"] < self.max_age:
+            return series
+        if now - meta["verified"] >= self.verify_age:
+            with stage(report, "fetch_series") as record:
+                content = urllib.request.urlopen(url).read()
+                record.bytes_fetched += len(content)
+                record.stations += 1
+            return self._compare(center, stn, series, size, content, report)
+
+        # Ask for a few bytes we already have as well; if they no longer
+        # match, the series was reprocessed rather than appended to.
+        start = max(size - OVERLAP, 0)
+        request = urllib.request.Request(url)
+        request.add_header("Range", "bytes={:d}-".format(start))
+        with stage(report, "fetch_series") as record:
+            try:
+                response = urllib.request.urlopen(request)
+                content = response.read()
+            except urllib.error.HTTPError as error:
+                if error.code != 416:
+                    raise
+                # the file is now shorter than what we hold
+                content = None
+            record.stations += 1
+            if content is not None:
+                record.bytes_fetched += len(content)
+
+        if content is None:
+            return self._full(center, stn, url, report)
+        if response.status != 206:
+            # server ignored the range and sent the whole file
+            return self._compare(center, stn, series, size, content, report)
+        if (_range_start(response) != start
+                or content[:size - start] != self._raw(center, stn, start)):
+            return self._full(center, stn, url, report)
+        return self._append(center, stn, series, size, content[size - start:],
+                            meta["verified"], report)
+
+    def _compare(self, center, stn, series, size, content, report):
+        """Refresh from the whole file: parse only what follows the cached
+        copy when that is unchanged, else parse everything again."""
+        if content[:size] != self._raw(center, stn):
+            return self._parse_full(center, stn, content, report)
+        return self._append(center, stn, series, size, content[size:], time.time(), report)
+
+    def _append(self, center, stn, series, size, fresh, verified, report):
+        tail = _complete_lines(fresh)
+        with stage(report, "parse_series") as record:
+            new = parse_series(fresh.decode("utf-8").splitlines(), center)
+            record.rows_parsed += len(new["fracYr"])
+            series = append_series(series, new)
+        self._save(center, stn, size + len(tail), series, verified, tail=tail)
+        return series
+
+    def _full(self, center, stn, url, report):
+        with stage(report, "fetch_series") as record:
+            content = urllib.request.urlopen(url).read()
+            record.bytes_fetched += len(content)
+            record.stations += 1
+        return self._parse_full(center, stn, content, report)
+
+    def _parse_full(self, center, stn, content, report):
+        raw = _complete_lines(content)
+        with stage(report, "parse_series") as record:
+            series = parse_series(content.decode("utf-8").splitlines(), center)
+            record.rows_parsed += len(series["fracYr"])
+        self._save(center, stn, len(raw), series, time.time(), raw=raw)
+        return series
+
+def _range_start(response):
+    """First byte position of a 206 response, from 'bytes start-end/total'."""
+    value = response.headers.get("Content-Range", "")
+    try:
+        return int(value.split()[1].split("-")[0])
+    except (IndexError, ValueError):
+        return None
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+**PROGRAM**
+    velocity_field.py
+
+**PURPOSE**
+    Estimate station velocities in a region from the full time series
+    between two epochs, and optionally interpolate them onto a grid.
+
+    Each component of each station is fitted by weighted least squares with
+    an offset, a rate and annual and semi-annual sine/cosine terms.  The
+    normal equations of all stations are built at once with np.bincount and
+    solved as one stack of 6x6 systems; large regions are split into chunks
+    of stations fitted over a process pool.  Stations with fewer than
+    MIN_SPAN years of data between the epochs are left out, as their rate
+    cannot be told apart from the seasonal terms.
+
+    The output is the usual kml and table files of getDisplacementNGL.py,
+    in mm/yr instead of mm, so <output>_table.txt loads with load_gps_data
+    just like a velocity table from GeoGateway.  With --grid the rates are
+    also interpolated with gps_interpolation.interpolate and the grid is
+    written to <output>_grid.csv.
+
+    Takes the same options as getDisplacementNGL.py; the averaging windows,
+    --estimator and --cache are ignored.
+
+**EXAMPLE**
+    velocity_field.py --lat 33.2 --lon -115.7 --width 1.6 --height 1.4 -t1 2010-01-01 -t2 2020-01-01 -j 4 --grid 0.02 -o saltonsea_velocity
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import getDisplacementNGL
+from getDisplacementNGL import (getSettings, objdict, readRegionSeries, readSeries,
+                                readStationTable, writeOutput)
+from epoch_estimators import COMPONENTS
+from series_store import SeriesStore
+from stage_timer import PipelineReport, stage
+
+PARAMETERS = ("offset", "rate", "cos1", "sin1", "cos2", "sin2")
+
+# Shortest stretch of data, in years, a rate is estimated from
+MIN_SPAN = 2.0
+
+# Stations per process pool task
+CHUNK = 200
+
+# Names interpolate gets the components under, as in the notebook
+INTERPOLATION_COLUMNS = ("Delta E", "Delta N", "Delta V")
+
+
+def _samples(seriesList, tmin, tmax):
+    """Concatenate the samples between tmin and tmax of every series, with
+    the index of their station."""
+    keeps = []
+    for series in seriesList:
+        keep = np.ones(len(series["fracYr"]), dtype=bool)
+        if tmin is not None:
+            keep &= series["fracYr"] >= tmin
+        if tmax is not None:
+            keep &= series["fracYr"] <= tmax
+        keeps.append(keep)
+    counts = np.array([np.count_nonzero(keep) for keep in keeps], dtype=int)
+    station = np.repeat(np.arange(len(seriesList)), counts)
+
+    def column(name):
+        return np.concatenate([np.empty(0)] + [series[name][keep]
+                              for series, keep in zip(seriesList, keeps)])
+
+    pos = np.column_stack([column(p) for p, _ in COMPONENTS]).reshape(-1, 3)
+    sig = np.column_stack([column(s) for _, s in COMPONENTS]).reshape(-1, 3)
+    return station, column("fracYr"), pos, sig, counts
+
+
+def _design(t, mid):
+    """Design matrix columns of PARAMETERS; time is taken from the middle of
+    each station's data so offset and rate are not correlated needlessly."""
+    phase = 2 * np.pi * t
+    return np.column_stack([np.ones_like(t), t - mid, np.cos(phase), np.sin(phase),
+                            np.cos(2 * phase), np.sin(2 * phase)])
+
+
+def _solve(normal, rhs):
+    try:
+        inverse = np.linalg.inv(normal)
+    except np.linalg.LinAlgError:
+        inverse = np.linalg.pinv(normal)
+    return np.einsum("sij,sj->si", inverse, rhs), inverse
+
+
+def fitVelocities(seriesList, tmin=None, tmax=None, minSpan=MIN_SPAN):
+    """
+    Fit offset, rate and annual and semi-annual terms to the E, N, U samples
+    of every series between tmin and tmax (fractional years).
+
+    Returns (rates, variances, counts): arrays of shape (n, 3) in m/yr and
+    (m/yr)^2, and (n,) samples used.  Stations spanning less than minSpan
+    years, or with fewer samples than twice the parameters, get nan rates.
+    """
+    n = len(seriesList)
+    m = len(PARAMETERS)
+    station, t, pos, sig, counts = _samples(seriesList, tmin, tmax)
+    rates = np.full((n, 3), np.nan)
+    variances = np.full((n, 3), np.nan)
+    if len(t) == 0:
+        return rates, variances, counts
+
+    first = np.full(n, np.inf)
+    last = np.full(n, -np.inf)
+    np.minimum.at(first, station, t)
+    np.maximum.at(last, station, t)
+    usable = (counts >= 2 * m) & (last - first >= minSpan)
+    if not usable.any():
+        return rates, variances, counts
+    design = _design(t, ((first + last) / 2)[station])
+
+    for k in range(3):
+        weights = 1 / sig[:, k] ** 2
+        normal = np.empty((n, m, m))
+        rhs = np.empty((n, m))
+        for i in range(m):
+            rhs[:, i] = np.bincount(station, weights * design[:, i] * pos[:, k], minlength=n)
+            for j in range(i, m):
+                normal[:, i, j] = normal[:, j, i] = np.bincount(
+                    station, weights * design[:, i] * design[:, j], minlength=n)
+        solution, inverse = _solve(normal[usable], rhs[usable])
+        rates[usable, k] = solution[:, 1]
+        variances[usable, k] = inverse[:, 1, 1]
+    return rates, variances, counts
+
+
+def _fitChunk(task):
+    return fitVelocities(*task)
+
+
+def fitChunked(seriesList, tmin=None, tmax=None, workers=None):
+    """fitVelocities over chunks of CHUNK stations, in a process pool when
+    workers is more than one and there is more than one chunk."""
+    tasks = [(seriesList[i:i + CHUNK], tmin, tmax) for i in range(0, len(seriesList), CHUNK)]
+    if len(tasks) < 2 or workers is None or workers < 2:
+        return fitVelocities(seriesList, tmin, tmax)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        parts = list(pool.map(_fitChunk, tasks))
+    return tuple(np.concatenate(values) for values in zip(*parts))
+
+
+def computeVelocities(settings, report=None, store=None, fileLines=None, workers=None):
+    """
+    Return rows of [site,lon,lat,vE,vN,vV,sE,sN,sV] (mm/yr) for the stations
+    inside the bounds of settings, fitted to their data between the epochs
+    of settings and relative to its reference site.
+    """
+    analysisCenter = settings.analysisCenter
+    tmin, tmax = settings.ytime1, settings.ytime2
+    if fileLines is None:
+        fileLines = readStationTable(analysisCenter, report)
+
+    reference = np.zeros(3)
+    if settings.refsite != 'NONE':
+        series = readSeries(settings.refsite, analysisCenter, store, report)
+        with stage(report, "fit_velocities"):
+            rate, _, _ = fitVelocities([series], tmin, tmax)
+        if np.isnan(rate).any():
+            print("Reference site has too short a series!")
+            return []
+        reference = 1000. * rate[0]
+
+    locations, seriesList = readRegionSeries(settings, fileLines, store, report)
+    with stage(report, "fit_velocities") as record:
+        rates, variances, counts = fitChunked(seriesList, tmin, tmax, workers)
+        record.stations += len(seriesList)
+        record.rows_parsed += int(counts.sum())
+
+    velocities = 1000. * rates - reference
+    if settings.vabs:
+        velocities[:, 2] += reference[2]
+    sigmas = 1000. * np.sqrt(variances)
+
+    data_table = []
+    for k, location in enumerate(locations):
+        if not np.isnan(rates[k]).any():
+            data_table.append([location.stn, location.lon, location.lat]
+                              + [float(v) for v in velocities[k]]
+                              + [float(v) for v in sigmas[k]])
+    return data_table
+
+
+def interpolationInput(data_table):
+    """
+    Return lon, lat and {column: values} of the rows, to be passed on as
+    interpolate(lon, lat, **columns); the columns are named like those of
+    load_gps_data so the notebook cells work on the result unchanged.
+    """
+    table = np.array([row[1:6] for row in data_table], dtype=float).reshape(-1, 5)
+    columns = {name: table[:, 2 + k] for k, name in enumerate(INTERPOLATION_COLUMNS)}
+    return table[:, 0], table[:, 1], columns
+
+
+def interpolateVelocities(data_table, grid_spacing=0.004, model="spherical", report=None):
+    """Krige the rates of the rows onto a grid; returns the DataFrame of
+    gps_interpolation.interpolate."""
+    from gps_interpolation import interpolate
+
+    lon, lat, columns = interpolationInput(data_table)
+    return interpolate(lon, lat, grid_spacing=grid_spacing, model=model,
+                       report=report, **columns)
+
+
+def velocityField(results, report=None, store=None, fileLines=None, workers=None):
+    """
+    Fit the velocities of the stations in the region of results (command
+    line results or the equivalent dict), write the kml and table files and
+    return the table rows.
+    """
+    if type(results) is dict:
+        results = objdict(results)
+    settings = getSettings(results)
+
+    with stage(report, "velocityField") as record:
+        data_table = computeVelocities(settings, report, store, fileLines, workers)
+        with stage(report, "write_output"):
+            writeOutput(settings, data_table)
+        record.stations += len(data_table)
+    return data_table
+
+
+def _getParser():
+    parser = getDisplacementNGL._getParser()
+    parser.description = __doc__
+    parser.epilog = None
+    parser.add_argument('-j', action='store', dest='workers', type=int, required=False,
+                        help='number of worker processes for the fit')
+    parser.add_argument('--grid', action='store', dest='grid', type=float, required=False,
+                        help='also interpolate onto a grid with this spacing in degrees')
+    parser.add_argument('--model', action='store', dest='model', default='spherical',
+                        help='variogram model for --grid')
+    return parser
+
+
+def main():
+    results = _getParser().parse_args()
+    store = SeriesStore(results.store) if results.store else None
+    report = None
+    if results.timing or results.profile or results.traceMemory:
+        report = PipelineReport(trace_memory=results.traceMemory, profile_dir=results.profile)
+    data_table = velocityField(results, report=report, store=store, workers=results.workers)
+    print("{:d} station velocities".format(len(data_table)))
+    if results.grid and len(data_table):
+        grid = interpolateVelocities(data_table, grid_spacing=results.grid,
+                                     model=results.model, report=report)
+        grid.to_csv(results.output + "_grid.csv", index=False)
+    if report is not None:
+        report.close()
+        report.print_summary()
+        if results.timing:
+            report.save(results.timing)
+
+
+if __name__ == "__main__":
+    main()
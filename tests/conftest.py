@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+"""
+Offline test fixtures: small synthetic archives from benchmarks/ served by
+the mock data server, with getDisplacementNGL pointed at it.
+"""
+
+import os
+import sys
+
+import pytest
+
+top = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for subdir in ("getDisplacement", "benchmarks"):
+    sys.path.insert(0, os.path.join(top, subdir))
+
+import getDisplacementNGL
+from synthetic_gnss import make_stations, write_archive
+from mock_server import MockDataServer
+
+REGION = {"lat": 33.0, "lon": -115.0, "width": 2.0, "height": 2.0}
+
+
+@pytest.fixture
+def stations():
+    return make_stations(6, **REGION)
+
+
+@pytest.fixture
+def archive(tmp_path, stations):
+    return write_archive(str(tmp_path / "archive"), stations, years=3.0)
+
+
+@pytest.fixture(params=[True, False], ids=["ranges", "noranges"])
+def server(request, archive, monkeypatch):
+    """Mock server with and without Range support, installed as the data
+    source of getDisplacementNGL."""
+    with MockDataServer(archive, ranges=request.param) as server:
+        monkeypatch.setattr(getDisplacementNGL, "dataSources", server.sources())
+        yield server
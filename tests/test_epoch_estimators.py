@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""epoch_estimators.estimate on small hand-made series."""
+
+import numpy as np
+import pytest
+
+import getDisplacementNGL
+from epoch_estimators import ESTIMATORS, estimate, group_median
+from series_store import FIELDS
+
+DAY = 1 / 365.25
+
+
+def _series(t, e, n=None, u=None, sig=0.002):
+    t = np.asarray(t, dtype=float)
+    e = np.asarray(e, dtype=float)
+    sigma = np.broadcast_to(np.asarray(sig, dtype=float), t.shape).copy()
+    columns = (t, e, np.array(e if n is None else n, dtype=float),
+               np.array(e if u is None else u, dtype=float), sigma, sigma.copy(), sigma.copy())
+    return dict(zip(FIELDS, columns))
+
+
+def _daily(rng, epoch, days, noise=0.001):
+    t = epoch + DAY * np.arange(-days, days + 1)
+    sig = rng.uniform(0.001, 0.003, len(t))
+    return _series(t, rng.normal(0, noise, len(t)), sig=sig)
+
+
+def test_wmean_matches_window_sums():
+    """Same numbers as the inverse-variance sums getDisplacement used."""
+    rng = np.random.default_rng(1)
+    seriesList = [_daily(rng, 2010.0, 20) for _ in range(4)]
+    ytime, dwin = 2010.0, 10 * DAY
+    means, variances, counts = estimate(seriesList, ytime, dwin)
+    for k, series in enumerate(seriesList):
+        near = np.abs(series["fracYr"] - ytime) < dwin
+        assert counts[k] == np.count_nonzero(near)
+        for j, (pos, sig) in enumerate((("ePos", "eSig"), ("nPos", "nSig"), ("uPos", "uSig"))):
+            weights = 1 / series[sig][near] ** 2
+            assert means[k, j] == pytest.approx(np.sum(series[pos][near] * weights) / np.sum(weights),
+                                                rel=1e-12)
+            assert variances[k, j] == pytest.approx(1 / np.sum(weights), rel=1e-12)
+
+
+def test_mad_rejects_outlier():
+    rng = np.random.default_rng(2)
+    series = _daily(rng, 2010.0, 7, noise=0.0005)
+    clean, _, _ = estimate([series], 2010.0, 8 * DAY, "mad")
+    series["ePos"][3] += 0.5
+    wmean, _, _ = estimate([series], 2010.0, 8 * DAY, "wmean")
+    mad, _, _ = estimate([series], 2010.0, 8 * DAY, "mad")
+    assert abs(wmean[0, 0] - clean[0, 0]) > 0.01
+    assert mad[0, 0] == pytest.approx(clean[0, 0], abs=1e-4)
+    # the other components keep all their samples
+    assert mad[0, 1] == pytest.approx(clean[0, 1], abs=1e-12)
+
+
+def test_trend_at_window_edge():
+    """A line through samples on one side of the epoch, as at the end of a
+    series, is extrapolated instead of averaged."""
+    t = 2010.0 - DAY * np.arange(10)
+    series = _series(t, 0.01 + 0.02 * (t - 2010.0))
+    trend, _, counts = estimate([series], 2010.0, 15 * DAY, "trend")
+    wmean, _, _ = estimate([series], 2010.0, 15 * DAY, "wmean")
+    assert counts[0] == 10
+    assert trend[0, 0] == pytest.approx(0.01, abs=1e-9)
+    assert wmean[0, 0] < 0.01 - 1e-4
+
+
+def test_one_epoch_window():
+    series = _series([2009.9, 2010.0, 2010.1], [1.0, 2.0, 3.0])
+    for estimator in ESTIMATORS:
+        means, variances, counts = estimate([series], 2010.0, 2 * DAY, estimator)
+        assert counts[0] == 1
+        assert means[0, 0] == pytest.approx(2.0)
+        assert variances[0, 0] == pytest.approx(0.002 ** 2)
+
+
+def test_empty_window():
+    series = _series([2009.0, 2011.0], [1.0, 2.0])
+    for estimator in ESTIMATORS:
+        means, _, counts = estimate([series], 2010.0, 10 * DAY, estimator)
+        assert counts[0] == 0
+        assert np.isnan(means[0]).all()
+
+
+def test_group_median():
+    station = np.array([0, 2, 0, 2, 0, 2, 2])
+    values = np.array([5.0, 4.0, 1.0, 1.0, 3.0, 3.0, 2.0])
+    median = group_median(station, values, 4)
+    np.testing.assert_array_equal(median[[0, 2]], [3.0, 2.5])
+    assert np.isnan(median[[1, 3]]).all()
+    assert np.isnan(group_median(station[:0], values[:0], 2)).all()
+
+
+def test_unknown_estimator():
+    with pytest.raises(ValueError):
+        estimate([], 2010.0, DAY, "median")
+
+
+def test_command_line_names():
+    assert getDisplacementNGL.estimatorNames == ESTIMATORS
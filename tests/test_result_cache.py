@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""result_cache.ResultCache answers for sub-boxes of cached regions while
+their data is unchanged."""
+
+import datetime
+import os
+
+import pytest
+
+from getDisplacementNGL import displacementTable, getSettings, objdict, sourceStamps
+from result_cache import ResultCache
+from stage_timer import PipelineReport
+from synthetic_gnss import write_jpl_series
+
+
+def _settings(tmp_path, lat, lon, width, height, center="JPL"):
+    return getSettings(objdict(
+        lat=lat, lon=lon, width=width, height=height, epoch1="2006-01-01",
+        epoch2="2007-06-01", analysisCenter=center, ref=None, dwin1=None,
+        dwin2=None, vabs=False, scale=None, mon=False, eon=False,
+        output=str(tmp_path / "out")))
+
+
+@pytest.mark.parametrize("center", ["JPL", "NGL"])
+def test_sub_box_matches_fresh_run(tmp_path, server, center):
+    cache = ResultCache(str(tmp_path / "cache"))
+    wide = _settings(tmp_path, 33.0, -115.0, 2.2, 2.2, center)
+    rows = displacementTable(wide, cache=cache)
+    assert len(rows) > 2
+
+    small = _settings(tmp_path, 33.2, -115.1, 1.0, 1.2, center)
+    cached = cache.lookup(small, sourceStamps)
+    assert cached is not None
+    fresh = displacementTable(small)
+    assert 0 < len(fresh) < len(rows)
+    assert cached == fresh
+
+
+def test_other_parameters_miss(tmp_path, server):
+    cache = ResultCache(str(tmp_path / "cache"))
+    displacementTable(_settings(tmp_path, 33.0, -115.0, 2.2, 2.2), cache=cache)
+    assert cache.lookup(_settings(tmp_path, 33.0, -115.0, 2.2, 2.2, "NGL")) is None
+    outside = _settings(tmp_path, 33.0, -115.0, 3.0, 3.0)
+    assert cache.lookup(outside) is None
+    mirror = objdict(_settings(tmp_path, 33.0, -115.0, 2.2, 2.2),
+                     tableSource="http://mirror.example/table2.html")
+    assert cache.lookup(mirror) is None
+
+
+def test_changed_series_miss(tmp_path, archive, server, stations):
+    cache = ResultCache(str(tmp_path / "cache"))
+    settings = _settings(tmp_path, 33.0, -115.0, 2.2, 2.2)
+    displacementTable(settings, cache=cache)
+    assert cache.lookup(settings, sourceStamps) is not None
+
+    station = stations[0]
+    filename = os.path.join(archive, "jpl", "series", station["stn"] + ".series")
+    write_jpl_series(filename, station, datetime.date(2005, 1, 1), 3.5)
+    assert cache.lookup(settings, sourceStamps) is None
+    # without stamps to check, the entry holds until max_age
+    assert cache.lookup(settings) is not None
+
+    with PipelineReport() as report:
+        rows = displacementTable(settings, report, cache=cache)
+    # the stamps checked by the lookup are stored again, not requested twice
+    assert report.stages["check_sources"].calls == 1
+    assert cache.lookup(settings, sourceStamps) == rows
+
+
+def test_sub_box_checks_its_stations(tmp_path, archive, server, stations):
+    cache = ResultCache(str(tmp_path / "cache"))
+    wide = _settings(tmp_path, 33.0, -115.0, 2.2, 2.2)
+    displacementTable(wide, cache=cache)
+    small = _settings(tmp_path, 33.2, -115.1, 1.0, 1.2)
+    inside = [station for station in stations
+              if small.lonmin < station["lon"] < small.lonmax
+              and small.latmin < station["lat"] < small.latmax]
+    outside = [station for station in stations if station not in inside]
+    assert inside and outside
+
+    checked = []
+
+    def stamps(urls):
+        checked.extend(urls)
+        return sourceStamps(urls)
+
+    assert cache.lookup(small, stamps) is not None
+    sources = server.sources()["JPL"]
+    assert sorted(checked) == sorted([sources["table"]] + [sources["series"].format(station["stn"])
+                                                           for station in inside])
+
+    # a series outside the small box only outdates the wide box
+    station = outside[0]
+    filename = os.path.join(archive, "jpl", "series", station["stn"] + ".series")
+    write_jpl_series(filename, station, datetime.date(2005, 1, 1), 3.5)
+    assert cache.lookup(small, sourceStamps) is not None
+    assert cache.lookup(wide, sourceStamps) is None
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""Refreshes of series_store.SeriesStore against the mock data server."""
+
+import datetime
+import os
+
+import numpy as np
+import pytest
+
+from series_store import FIELDS, SeriesStore, fetch_series
+from stage_timer import PipelineReport
+from synthetic_gnss import write_jpl_series, write_ngl_series
+
+START = datetime.date(2005, 1, 1)
+
+WRITERS = {
+    "JPL": (write_jpl_series, os.path.join("jpl", "series", "{:s}.series")),
+    "NGL": (write_ngl_series, os.path.join("ngl", "tenv3", "{:s}.tenv3")),
+}
+
+
+def _file(archive, center, station):
+    return os.path.join(archive, WRITERS[center][1].format(station["stn"]))
+
+
+def _rewrite(archive, center, station, years):
+    """Write the series again with another length; the common epochs come
+    out identical, so a longer series is an append."""
+    WRITERS[center][0](_file(archive, center, station), station, START, years)
+
+
+def _get(store, server, center, station):
+    url = server.sources()[center]["series"].format(station["stn"])
+    with PipelineReport() as report:
+        series = store.get(center, station["stn"], url, report=report)
+    stages = {record.name: record for record in report.stages.values()}
+    return series, stages
+
+
+def _reference(server, center, station):
+    return fetch_series(server.sources()[center]["series"].format(station["stn"]), center)
+
+
+def _assert_same(series, reference):
+    for name in FIELDS:
+        np.testing.assert_array_equal(series[name], reference[name])
+
+
+@pytest.mark.parametrize("center", ["JPL", "NGL"])
+def test_append(tmp_path, archive, server, stations, center):
+    store = SeriesStore(str(tmp_path / "store"))
+    station = stations[0]
+    first, _ = _get(store, server, center, station)
+    size = os.path.getsize(_file(archive, center, station))
+
+    _rewrite(archive, center, station, 3.5)
+    series, stages = _get(store, server, center, station)
+    _assert_same(series, _reference(server, center, station))
+    assert stages["parse_series"].rows_parsed == len(series["fracYr"]) - len(first["fracYr"])
+    if server.httpd.ranges:
+        assert stages["fetch_series"].bytes_fetched < os.path.getsize(
+            _file(archive, center, station)) - size + 1024
+
+
+def test_unchanged(tmp_path, server, stations):
+    store = SeriesStore(str(tmp_path / "store"))
+    station = stations[0]
+    first, _ = _get(store, server, "JPL", station)
+    series, stages = _get(store, server, "JPL", station)
+    _assert_same(series, first)
+    assert stages["parse_series"].rows_parsed == 0
+
+
+def test_max_age_skips_server(tmp_path, server, stations):
+    store = SeriesStore(str(tmp_path / "store"), max_age=3600)
+    _get(store, server, "JPL", stations[0])
+    _, stages = _get(store, server, "JPL", stations[0])
+    assert "fetch_series" not in stages
+
+
+def test_shrunk(tmp_path, archive, server, stations):
+    store = SeriesStore(str(tmp_path / "store"))
+    station = stations[0]
+    _get(store, server, "JPL", station)
+    _rewrite(archive, "JPL", station, 2.0)
+    series, _ = _get(store, server, "JPL", station)
+    _assert_same(series, _reference(server, "JPL", station))
+
+
+def test_reprocessed_tail(tmp_path, archive, server, stations):
+    store = SeriesStore(str(tmp_path / "store"))
+    station = stations[0]
+    _get(store, server, "JPL", station)
+    filename = _file(archive, "JPL", station)
+    with open(filename) as inFile:
+        lines = inFile.readlines()
+    # same size, different last position
+    lines[-1] = lines[-1].replace(lines[-1].split()[1], "9" * len(lines[-1].split()[1]), 1)
+    with open(filename, "w") as outFile:
+        outFile.writelines(lines)
+    series, _ = _get(store, server, "JPL", station)
+    _assert_same(series, _reference(server, "JPL", station))
+
+
+def test_reprocessed_early_epoch(tmp_path, archive, server, stations):
+    store = SeriesStore(str(tmp_path / "store"), verify_age=0)
+    station = stations[0]
+    _get(store, server, "JPL", station)
+    filename = _file(archive, "JPL", station)
+    with open(filename) as inFile:
+        lines = inFile.readlines()
+    lines[10] = lines[10].replace(lines[10].split()[1], "9" * len(lines[10].split()[1]), 1)
+    with open(filename, "w") as outFile:
+        outFile.writelines(lines)
+    series, _ = _get(store, server, "JPL", station)
+    _assert_same(series, _reference(server, "JPL", station))
+
+
+def test_unterminated_last_line(tmp_path, archive, server, stations):
+    store = SeriesStore(str(tmp_path / "store"))
+    station = stations[0]
+    filename = _file(archive, "JPL", station)
+    with open(filename) as inFile:
+        content = inFile.read()
+    with open(filename, "w") as outFile:
+        outFile.write(content.rstrip("\n"))
+    series, _ = _get(store, server, "JPL", station)
+    _assert_same(series, _reference(server, "JPL", station))
+
+    # once the line is complete and more follow, nothing is doubled
+    _rewrite(archive, "JPL", station, 3.5)
+    series, _ = _get(store, server, "JPL", station)
+    _assert_same(series, _reference(server, "JPL", station))